@@ -1,19 +1,45 @@
+import os
 import sys
+import json
 import time
+import hashlib
 import traceback
 import logging
 import pandas as pd
-import re
 import gc
 from PyQt5.QtCore import QThread, pyqtSignal
-from rule_handler import read_enum_mapping, read_erp_combo_map
+from rule_handler import (
+    load_rule_artifacts, build_pk_series, chunk_pk_series, map_category_series,
+    PK_COLUMN, CATEGORY_CODE_COLUMN
+)
+from functools import partial
+from rule_expr import compile_rule
+from data_handler import row_hash_series, estimate_sheet_rows, parse_workers, sanitize_column_name
+from process_pool import run_sides
+import memory_comparator
+from result_index import ResultIndex
+from result_store import RowTable, DiffTable
 from db_handler import (
-    init_database, import_excel_to_db, execute_query, drop_tables,
-    create_compare_index, fetch_rows_by_pk, prepare_asset_category_mapping, _load_asset_category_mapping
+    init_database, import_excel_to_db, execute_query, iter_query, drop_tables,
+    fetch_rows_by_pk,
+    fingerprint_sheet, store_table_name, find_import, register_import,
+    changed_keys, latest_compare_run, save_compare_run,
+    engine_settings, apply_engine_settings, supports_multiprocess, set_db_engine, numeric_sql_type,
+    ROW_HASH_COLUMN
 )
 
 TEMP_TABLE1 = 'temp_table1'
 TEMP_TABLE2 = 'temp_table2'
+# _diff_by_mysql 返回的主键归属：共同 / 表二缺失 / 表二多余
+KEY_COMMON = 'C'
+KEY_MISSING = 'M'
+KEY_EXTRA = 'E'
+# 比对引擎：MySQL 临时表 / 内嵌 SQLite 库（无需数据库服务）/ 纯内存 pandas
+BACKEND_MYSQL = 'mysql'
+BACKEND_SQLITE = 'sqlite'
+BACKEND_MEMORY = 'memory'
+# progress_signal：导入阶段占 0~80，主键归属完成 90，比对结束 100
+_IMPORT_PROGRESS = 80
 
 
 class CompareWorker(QThread):
@@ -21,7 +47,8 @@ class CompareWorker(QThread):
     progress_signal = pyqtSignal(int)
 
     def __init__(self, file1, file2, rule_file, sheet_name1, sheet_name2,
-                 primary_keys=None, rules=None, skip_rows=0, chunk_size=5000):
+                 primary_keys=None, rules=None, skip_rows=0, chunk_size=5000, backend=BACKEND_MYSQL,
+                 incremental=False):
         super().__init__()
         self.file1 = file1
         self.file2 = file2
@@ -29,19 +56,29 @@ class CompareWorker(QThread):
         self.sheet_name1 = sheet_name1
         self.sheet_name2 = sheet_name2
         self.primary_keys = primary_keys if primary_keys else []
-        self.rules = rules if rules else {}
+        # 规则文件只解析一次，各查找表为只读视图
+        self.artifacts = load_rule_artifacts(rule_file)
+        self.rules = rules if rules else self.artifacts.rules
         self.skip_rows = skip_rows
         self.chunk_size = chunk_size
+        self.backend = backend
+        self._frames = None  # 内存引擎下的 (表一, 表二)
+        # 数据库引擎下是否使用导入仓库：未变化的一侧不再导入，只重比变化的主键
+        # 需对两个文件做 SHA-256 并在库中保留 store_* 表，默认关闭，由界面勾选开启
+        self.incremental = incremental
+        self.table1 = TEMP_TABLE1
+        self.table2 = TEMP_TABLE2
+        self._fingerprints = None  # 导入仓库中两表的内容指纹
+        self._diff_keys = None  # 本次判定有差异的 _pk_concat
 
-        self.missing_assets = []
-        self.diff_records = []
         self.summary = {}
-        self.missing_rows = []
-        self.extra_in_file2 = []
-        self.diff_full_rows = []
-        self.enum_map = read_enum_mapping(rule_file)
-        self.erp_combo_map = read_erp_combo_map(rule_file)
-        self.asset_code_to_original = {}
+        # 比对结果按列存储，按下标取到的是只读字典视图
+        self.missing_rows = RowTable()
+        self.extra_in_file2 = RowTable()
+        self.diff_full_rows = DiffTable.empty()
+        self.result_index = None  # 按 _pk_concat 建立的比对结果索引，供导出按块对齐
+        self.enum_map = self.artifacts.enum_map
+        self.erp_combo_map = self.artifacts.erp_combo_map
 
     # ---------- 工具 ----------
     @staticmethod
@@ -50,126 +87,71 @@ class CompareWorker(QThread):
             return ''
         return str(val).strip()
 
-    def _normalize_text_value(self, value):
-        """
-        标准化文本值，将具有相同含义的不同表示转换为统一形式
-        """
-        if pd.isna(value) or value is None:
-            return ''
-
-        str_value = str(value).strip().upper()  # 转换为大写以便统一比较
-
-        # 处理"是"的表示：是、Y、y
-        if str_value in ['是', 'Y']:
-            return '是'
-
-        # 处理"否"的表示：否、N、n
-        if str_value in ['否', 'N']:
-            return '否'
-
-        return str(value).strip()  # 其他情况返回原始值（保持原始大小写）
-
-    def _normalize_depreciation_method(self, value, is_file1=True):
-        """
-        标准化折旧方法字段值
-        如果是表二且值为"直线法"，则转换为"年限平均法"
-        """
-        if pd.isna(value) or value is None:
-            return ''
-
-        str_value = str(value).strip()
-
-        # 对于表二，将"直线法"转换为"年限平均法"
-        if not is_file1 and str_value == '直线法':
-            return '年限平均法'
+    def _describe_field_diff(self, field_name, src, tgt):
+        """差异字段的日志描述，数值按尾差位数显示，资产分类附带比较的编码前两位"""
+        rule = self.rules.get(field_name, {})
+        src_value = self.normalize_value(src.get(field_name))
+        tgt_value = self.normalize_value(tgt.get(field_name))
+        if field_name == "资产分类":
+            src_code = self.normalize_value(src.get(CATEGORY_CODE_COLUMN))
+            tgt_code = self.normalize_value(tgt.get("资产明细类别"))
+            return (f"{field_name}: 表一='{src_value}' ≠ 表二='{tgt_code}' "
+                    f"(编码前两位不匹配: {src_code[:2]} vs {tgt_code[:2]})")
+        if rule.get("data_type") == "数值":
+            try:
+                digits = int(float(rule.get("tail_diff") or 0))
+            except (TypeError, ValueError):
+                digits = 0
+            if digits > 0:
+                src_value = f"{float(src_value):.{digits}f}" if src_value else ""
+                tgt_value = f"{float(tgt_value):.{digits}f}" if tgt_value else ""
+        return f"{field_name}: 表一='{src_value}' ≠ 表二='{tgt_value}'"
 
-        return str(value).strip()
+    @staticmethod
+    def _throughput(rows, start_time):
+        """导入耗时与吞吐量描述"""
+        elapsed = max(time.time() - start_time, 1e-6)
+        return f"耗时 {elapsed:.1f}s（{rows / elapsed:.0f} 行/秒）"
 
-    def _extract_second_level(self, value):
+    def _column_types(self, is_file1=True):
         """
-        从监管资产属性中提取二级分类
-        支持两种格式：
-        1. '输配电资产\省级电网资产' -> '省级电网资产'
-        2. '电力常规资产-省级电网资产' -> '省级电网资产'
+        导入时的列类型：{列名: 数据类型}
+        表一按规则字段名；表二只对无计算规则的 table2_field 定类型，计算规则引用的列保持 LONGTEXT
         """
-        if not value or value.strip() == '':
-            return ''
-
-        # 处理反斜杠分隔的格式
-        if '\\' in value:
-            parts = value.split('\\')
-            return parts[-1].strip() if len(parts) > 1 else value.strip()
-
-        # 处理短横线分隔的格式
-        if '-' in value:
-            parts = value.split('-')
-            return parts[-1].strip() if len(parts) > 1 else value.strip()
-
-        # 如果没有分隔符，返回原值
-        return value.strip()
-
-    def calculate_field(self, df, calc_rule, data_type):
-        if not calc_rule:
-            return None
-        try:
-            if '[:' in calc_rule and ']' in calc_rule:
-                field, length_str = calc_rule.split('[:')
-                field = field.strip()
-                length = int(length_str.strip(']').strip())
-                if field not in df.columns:
-                    raise Exception(f"字段不存在：{field}")
-                return df[field].fillna('').astype(str).str[:length]
-
-            if data_type == "文本":
-                fields = [f.strip() for f in calc_rule.split('+')]
-                missing = [f for f in fields if f not in df.columns]
-                if missing:
-                    raise Exception(f"表达式含不存在字段：{missing}")
-                result = df[fields[0]].fillna('').astype(str)
-                for f in fields[1:]:
-                    result += df[f].fillna('').astype(str)
-                return result
-
-            if data_type == "数值":
-                field_pattern = re.compile(r'[a-zA-Z\u4e00-\u9fa5]+')
-                fields_in_rule = field_pattern.findall(calc_rule)
-                missing = [f for f in fields_in_rule if f not in df.columns]
-                if missing:
-                    raise Exception(f"表达式含不存在字段：{missing}")
-                df_num = df.copy()
-                return df_num.eval(calc_rule)
-
-            raise Exception(f"不支持的数据类型：{data_type}")
-        except Exception as e:
-            raise Exception(f"计算规则执行失败（{calc_rule}）：{str(e)}")
-
-    # ---------- SQL 侧主键 ----------
-    def _build_pk_expr(self, table_alias: str, is_file1: bool) -> str:
-        """生成 _pk_concat 的 SQL 表达式"""
-        # 先找主键字段对应的规则
-        pk_field = None
+        types = {}
+        for field_name, rule in self.rules.items():
+            if is_file1:
+                types.setdefault(field_name, rule.get("data_type"))
+            elif not rule.get("calc_rule") and rule.get("table2_field"):
+                types.setdefault(rule["table2_field"], rule.get("data_type"))
+        return types
+
+    # ---------- 主键 ----------
+    def _pk_rule(self):
+        """主键字段对应的规则"""
         for f, r in self.rules.items():
             if r.get("is_primary"):
-                pk_field = f
-                break
-        rule = self.rules.get(pk_field, {})
-        calc_rule = rule.get("calc_rule")
-
-        if is_file1:
-            # 表一：primary_keys 里的列直接拼
-            cols = [f"`{c}`" for c in self.primary_keys]
-            return "CONCAT_WS(' + ', " + ",".join(cols) + ")"
-        else:
-            # 表二：有计算规则就转 SQL，否则用 table2_field
-            if calc_rule:
-                expr = re.sub(r'\+', ",", calc_rule)
-                return f"CONCAT({expr})"
-            else:
-                col = rule.get("table2_field")
-                if col:
-                    return f"`{col}`"
-                else:
-                    raise Exception("规则文件中未给 ERP 表定义主键字段")
+                return r
+        return {}
+
+    def _pk_column(self, is_file1: bool):
+        """导入时随数据写入的 _pk_concat 列定义：{列名: (SQL 类型, 计算函数)}"""
+        builder = partial(build_pk_series, primary_keys=list(self.primary_keys),
+                          pk_rule=dict(self._pk_rule()), is_file1=is_file1)
+        return {PK_COLUMN: ("VARCHAR(255)", builder)}
+
+    def key_builder(self, is_file1: bool):
+        """从原始数据块计算 _pk_concat 的函数（与导入时一致），可传给子进程"""
+        return partial(chunk_pk_series, column_types=self._column_types(is_file1=is_file1),
+                       primary_keys=list(self.primary_keys), pk_rule=dict(self._pk_rule()), is_file1=is_file1)
+
+    def _computed_columns(self, is_file1: bool):
+        """导入时随数据写入的附加列：两表都有 _pk_concat，表一另有资产分类映射编码"""
+        columns = self._pk_column(is_file1)
+        if is_file1 and "资产分类" in self.rules:
+            builder = partial(map_category_series, field="资产分类", mapping=dict(self.artifacts.category_mapping))
+            columns[CATEGORY_CODE_COLUMN] = ("TEXT", builder)
+        return columns
 
     def _build_field_expr(self, field_name, is_file1=True):
         """
@@ -182,51 +164,16 @@ class CompareWorker(QThread):
             # 表一：直接使用字段名
             return f"`{field_name}`"
         else:
-            # 表二：如果有计算规则则转换为SQL表达式，否则使用table2_field或字段名
+            # 表二：如果有计算规则则编译为SQL表达式，否则使用table2_field或字段名
             if calc_rule:
-                # 处理不同类型的计算规则
-
-                # 检查是否是简单的字段截取规则，如 "字段[:10]"
-                if '[:' in calc_rule and ']' in calc_rule:
-                    field_part, length_str = calc_rule.split('[:')
-                    field_part = field_part.strip()
-                    length = int(length_str.strip(']').strip())
-                    return f"LEFT(`{field_part}`, {length})"
-
-                # 检查是否是文本拼接规则，如 "字段1+字段2"
-                elif rule.get("data_type") == "文本" and re.match(r'^[a-zA-Z\u4e00-\u9fa50-9_+\s]+$', calc_rule):
-                    # 只包含字段名、加号和空格的表达式认为是文本拼接
-                    fields = [f.strip() for f in calc_rule.split('+') if f.strip()]
-                    concat_fields = [f"`{f}`" for f in fields]
-                    return f"CONCAT({', '.join(concat_fields)})"
-
-                # 处理数值计算规则，如 "使用年限+使用期间/12"
-                elif rule.get("data_type") == "数值":
-                    # 将字段名加上反引号，支持四则运算
-                    field_pattern = re.compile(r'[a-zA-Z\u4e00-\u9fa5][a-zA-Z\u4e00-\u9fa50-9_]*')
-                    fields_in_rule = field_pattern.findall(calc_rule)
-
-                    expr = calc_rule
-                    # 替换字段名为带反引号的形式
-                    for field in sorted(fields_in_rule, key=len, reverse=True):  # 从长到短替换，避免部分匹配
-                        expr = expr.replace(field, f"`{field}`")
-                    return expr
-
-                else:
-                    return f"`{field_name}`"
+                if rule.get("data_type") in ("数值", "文本"):
+                    return compile_rule(calc_rule, rule.get("data_type")).to_sql()
+                return f"`{field_name}`"
             else:
                 # 没有计算规则，使用table2_field映射或默认字段名
                 table2_field = rule.get("table2_field", field_name)
                 return f"`{table2_field}`"
 
-    def _add_concat_pk_column(self, table: str, expr: str):
-        """给指定表增加 _pk_concat 列并填充"""
-        try:
-            execute_query(f"ALTER TABLE `{table}` ADD COLUMN `_pk_concat` VARCHAR(255)")
-        except Exception:
-            pass  # 列已存在
-        execute_query(f"UPDATE `{table}` SET `_pk_concat` = {expr}")
-
     def _process_depreciation_fields(self, table):
         """
         处理表中包含"折旧"的数值字段，将其转换为绝对值
@@ -255,7 +202,7 @@ class CompareWorker(QThread):
                 try:
                     expr = self._build_field_expr(field_name, is_file1=False)
                     # 添加计算字段列
-                    execute_query(f"ALTER TABLE `{table}` ADD COLUMN `_calc_{field_name}` DECIMAL(20,4)")
+                    execute_query(f"ALTER TABLE `{table}` ADD COLUMN `_calc_{field_name}` {numeric_sql_type()}")
                     # 如果是折旧相关字段，取绝对值
                     if "折旧" in field_name:
                         # 填充计算字段值，处理可能的除零错误，并取绝对值
@@ -264,8 +211,7 @@ class CompareWorker(QThread):
                         # 填充计算字段值，处理可能的除零错误
                         execute_query(f"UPDATE `{table}` SET `_calc_{field_name}` = COALESCE({expr}, 0)")
                 except Exception as e:
-                    # 列可能已存在，忽略错误
-                    pass
+                    self.log_signal.emit(f"计算字段 {field_name} 生成失败: {str(e)}")
 
             # 处理文本拼接计算规则
             elif calc_rule and not is_file1 and rule.get("data_type") == "文本":
@@ -276,53 +222,39 @@ class CompareWorker(QThread):
                     # 填充计算字段值
                     execute_query(f"UPDATE `{table}` SET `_calc_{field_name}` = {expr}")
                 except Exception as e:
-                    # 列可能已存在，忽略错误
-                    pass
+                    self.log_signal.emit(f"计算字段 {field_name} 生成失败: {str(e)}")
 
     def _diff_by_mysql(self):
-        """纯 SQL 完成交集/差集"""
-        # 查询共同的主键
-        common_sql = """
-        SELECT GROUP_CONCAT(t1._pk_concat SEPARATOR '||') AS common_keys
-        FROM temp_table1 t1
-        INNER JOIN temp_table2 t2 ON t1._pk_concat = t2._pk_concat
         """
-
-        # 查询在表1中存在但在表2中缺失的主键
-        missing_sql = """
-        SELECT GROUP_CONCAT(t1._pk_concat SEPARATOR '||') AS missing_keys
-        FROM temp_table1 t1
-        LEFT JOIN temp_table2 t2 ON t1._pk_concat = t2._pk_concat
-        WHERE t2._pk_concat IS NULL
+        纯 SQL 完成交集/差集：一条查询扫描两表各一次（借助 _pk_concat 索引做存在性判断），
+        以 (主键, 归属) 行的形式流式返回，返回 (共同主键, 表二缺失主键, 表二多余主键) 三个集合
         """
-
-        # 查询在表2中存在但表1中多余的主键
-        extra_sql = """
-        SELECT GROUP_CONCAT(t2._pk_concat SEPARATOR '||') AS extra_keys
-        FROM temp_table2 t2
-        LEFT JOIN temp_table1 t1 ON t2._pk_concat = t1._pk_concat
-        WHERE t1._pk_concat IS NULL
+        sql = f"""
+        SELECT t1.{PK_COLUMN},
+               CASE WHEN EXISTS (SELECT 1 FROM {self.table2} t2 WHERE t2.{PK_COLUMN} = t1.{PK_COLUMN})
+                    THEN '{KEY_COMMON}' ELSE '{KEY_MISSING}' END
+        FROM {self.table1} t1
+        UNION ALL
+        SELECT t2.{PK_COLUMN}, '{KEY_EXTRA}'
+        FROM {self.table2} t2
+        WHERE NOT EXISTS (SELECT 1 FROM {self.table1} t1 WHERE t1.{PK_COLUMN} = t2.{PK_COLUMN})
         """
-
-        common_result = execute_query(common_sql)
-        missing_result = execute_query(missing_sql)
-        extra_result = execute_query(extra_sql)
-
-        # 合并结果
-        result_df = pd.DataFrame({
-            'common_keys': [common_result.iloc[0, 0] if not common_result.empty and common_result.iloc[0, 0] else ''],
-            'missing_keys': [
-                missing_result.iloc[0, 0] if not missing_result.empty and missing_result.iloc[0, 0] else ''],
-            'extra_keys': [extra_result.iloc[0, 0] if not extra_result.empty and extra_result.iloc[0, 0] else '']
-        })
-
-        return result_df
-
-    def _compare_fields_in_db(self, common_codes):
+        key_sets = {KEY_COMMON: set(), KEY_MISSING: set(), KEY_EXTRA: set()}
+        for rows in iter_query(sql):
+            for key, side in rows:
+                if key is not None:  # 空主键无法参与匹配
+                    key_sets[side].add(key)
+        return key_sets[KEY_COMMON], key_sets[KEY_MISSING], key_sets[KEY_EXTRA]
+
+    def _compare_fields_in_db(self, common_codes, only_keys=None):
         """
         在数据库中对比字段差异
+        每个字段的差异条件同时作为 diff_<字段> 标记列返回，记录中的 diff_fields 即为判定不一致的字段，
+        日志和导出直接使用，不再重新比较
+        only_keys 不为 None 时只比对这些 _pk_concat（增量比对）
         """
-        diff_conditions = []
+        self._diff_keys = None
+        diff_conditions = {}
 
         # 为每个字段构建差异条件
         for field_name, rule in self.rules.items():
@@ -343,67 +275,58 @@ class CompareWorker(QThread):
                 tgt_field = f"`t2`.`{table2_field}`"
 
             # 根据数据类型构建差异条件，考虑空值情况
+            # 数值/日期列导入时已是 DECIMAL/DATE，空值即 NULL，直接按原生类型比较
+            # 文本两侧取 LOWER：MySQL 默认排序规则本就不区分大小写，sqlite 按字节比较，需显式统一（内存引擎同此）
+            both_null = f"NOT ({src_field} IS NULL AND {tgt_field} IS NULL)"
             if data_type == "数值":
                 if "折旧" in field_name:
-                    condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND ABS(IFNULL({src_field}, 0)) != ABS(IFNULL({tgt_field}, 0))"
-                    if float(tail_diff) > 0:
-                        condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND ABS(ABS(IFNULL({src_field}, 0)) - ABS(IFNULL({tgt_field}, 0))) > {tail_diff}"
+                    condition = f"{both_null} AND ABS(IFNULL({src_field}, 0)) != ABS(IFNULL({tgt_field}, 0))"
+                    if float(tail_diff or 0) > 0:
+                        condition = f"{both_null} AND ABS(ABS(IFNULL({src_field}, 0)) - ABS(IFNULL({tgt_field}, 0))) > {tail_diff}"
                 else:
                     # 修改数值比较逻辑，增加精度处理
-                    condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND IFNULL({src_field}, 0) != IFNULL({tgt_field}, 0)"
-                    if float(tail_diff) > 0:
+                    condition = f"{both_null} AND IFNULL({src_field}, 0) != IFNULL({tgt_field}, 0)"
+                    if float(tail_diff or 0) > 0:
                         # 使用ROUND函数处理精度，确保比较时两边有相同精度
                         rounded_src = f"ROUND(IFNULL({src_field}, 0), {tail_diff})"
                         rounded_tgt = f"ROUND(IFNULL({tgt_field}, 0), {tail_diff})"
-                        condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND ABS({rounded_src} - {rounded_tgt}) > {tail_diff}"
-                diff_conditions.append(condition)
+                        condition = f"{both_null} AND ABS({rounded_src} - {rounded_tgt}) > {tail_diff}"
+                diff_conditions[field_name] = condition
 
             elif data_type == "日期":
-                # 统一日期格式进行比较
-                condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND DATE_FORMAT(STR_TO_DATE(IFNULL({src_field}, ''), '%Y-%m-%d'), '%Y-%m-%d') != DATE_FORMAT(STR_TO_DATE(IFNULL({tgt_field}, ''), '%Y-%m-%d'), '%Y-%m-%d')"
-                diff_conditions.append(condition)
+                # 两侧均为 DATE 类型；任一侧为空时比较结果为 NULL，不计为差异（与按文本 STR_TO_DATE 比较时一致）
+                condition = f"{both_null} AND {src_field} != {tgt_field}"
+                diff_conditions[field_name] = condition
 
             elif data_type == "文本":
                 # 特殊处理资产分类字段
                 if field_name == "资产分类":
-                    # 对于资产分类，比较前两位编码（使用预先准备好的临时表）
+                    # 对于资产分类，比较前两位编码（映射编码已在导入表一时写入 CATEGORY_CODE_COLUMN）
                     # 表二实际用于对比的字段是"资产明细类别"
                     table2_field = "资产明细类别"
                     condition = f"""
                     NOT (IFNULL({src_field}, '') = '' AND IFNULL(t2.`{table2_field}`, '') = '') 
-                    AND (
-                        LEFT(
-                            IFNULL(
-                                (SELECT m.`同源目录编码` 
-                                 FROM temp_mapping_table m 
-                                 WHERE m.`同源目录完整名称` = {src_field} 
-                                 LIMIT 1), 
-                                {src_field}
-                            ), 
-                            2
-                        ) != LEFT(IFNULL(t2.`{table2_field}`, ''), 2)
-                    )
+                    AND LOWER(SUBSTR(`t1`.`{CATEGORY_CODE_COLUMN}`, 1, 2)) != LOWER(SUBSTR(IFNULL(t2.`{table2_field}`, ''), 1, 2))
                     """
-                    diff_conditions.append(condition)
+                    diff_conditions[field_name] = condition
                 # 对于折旧方法字段，需要特殊处理表二中的"直线法"视为"年限平均法"
                 elif "折旧方法" in field_name:
                     # 在SQL中处理：如果表二字段是"直线法"，则替换为"年限平均法"进行比较
                     adjusted_tgt_field = f"CASE WHEN TRIM(IFNULL({tgt_field}, '')) = '直线法' THEN '年限平均法' ELSE TRIM(IFNULL({tgt_field}, '')) END"
-                    condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND TRIM(IFNULL({src_field}, '')) != {adjusted_tgt_field}"
+                    condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND LOWER(TRIM(IFNULL({src_field}, ''))) != LOWER({adjusted_tgt_field})"
                 else:
-                    condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND TRIM(IFNULL({src_field}, '')) != TRIM(IFNULL({tgt_field}, ''))"
-                diff_conditions.append(condition)
+                    condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND LOWER(TRIM(IFNULL({src_field}, ''))) != LOWER(TRIM(IFNULL({tgt_field}, '')))"
+                diff_conditions[field_name] = condition
 
             else:
-                condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND IFNULL({src_field}, '') != IFNULL({tgt_field}, '')"
-                diff_conditions.append(condition)
+                condition = f"NOT (IFNULL({src_field}, '') = '' AND IFNULL({tgt_field}, '') = '') AND LOWER(IFNULL({src_field}, '')) != LOWER(IFNULL({tgt_field}, ''))"
+                diff_conditions[field_name] = condition
 
         if not diff_conditions:
-            return []  # 没有需要对比的字段
+            return DiffTable.empty()  # 没有需要对比的字段
 
-        # 构建主键选择表达式
+        # 构建主键选择表达式（表二按 _pk_concat 与表一匹配，不一定有同名主键列，主键值取表一）
         pk_fields_src = [f"`t1`.`{pk}`" for pk in self.primary_keys]
-        pk_fields_tgt = [f"`t2`.`{pk}`" for pk in self.primary_keys]
 
         # 构建所有需要返回的字段列表
         all_fields = list(self.rules.keys())
@@ -414,7 +337,6 @@ class CompareWorker(QThread):
         # 添加主键字段
         select_fields.append("t1._pk_concat")
         select_fields.extend(pk_fields_src)
-        select_fields.extend(pk_fields_tgt)
 
         # 添加源表字段
         for f in all_fields:
@@ -433,113 +355,255 @@ class CompareWorker(QThread):
                     table2_field = rule.get("table2_field", f)
                     select_fields.append(f"t2.`{table2_field}` as tgt_{f}")
 
-        # 特别确保资产明细类别字段被包含在查询结果中
+        # 特别确保资产明细类别字段、表一的映射编码被包含在查询结果中
         if "资产分类" in self.rules:
             select_fields.append("t2.`资产明细类别` as tgt_资产明细类别")
+            select_fields.append(f"t1.`{CATEGORY_CODE_COLUMN}`")
 
+        # 每个字段的差异标记
+        for field_name, cond in diff_conditions.items():
+            select_fields.append(f"CASE WHEN ({cond}) THEN 1 ELSE 0 END AS `diff_{field_name}`")
+
+        key_join = "INNER JOIN _wanted_keys k ON k._pk_concat = t1._pk_concat" if only_keys is not None else ""
         sql = f"""
         SELECT 
             {', '.join(select_fields)}
-        FROM {TEMP_TABLE1} t1
-        INNER JOIN {TEMP_TABLE2} t2 ON t1._pk_concat = t2._pk_concat
-        WHERE {' OR '.join([f'({cond})' for cond in diff_conditions])}
+        FROM {self.table1} t1
+        INNER JOIN {self.table2} t2 ON t1._pk_concat = t2._pk_concat
+        {key_join}
+        WHERE {' OR '.join([f'({cond})' for cond in diff_conditions.values()])}
         """
 
         try:
-            result_df = execute_query(sql)
-            diff_records = []
-
-            if not result_df.empty:
-                for _, row in result_df.iterrows():
-                    src_data = {}
-                    tgt_data = {}
-
-                    # 主键字段
-                    for pk in self.primary_keys:
-                        src_data[pk] = row[pk]
-                        tgt_data[pk] = row[f"{pk}"]  # 注意这里可能需要调整列名
-
-                    # 其他字段
-                    for field in all_fields:
-                        if not self.rules[field].get("is_primary"):
-                            src_data[field] = row[f"src_{field}"]
-                            tgt_data[field] = row[f"tgt_{field}"]
-
-                    # 特别处理资产明细类别字段
-                    if "资产分类" in self.rules:
-                        tgt_data["资产明细类别"] = row["tgt_资产明细类别"]
+            result_df = execute_query(sql, wanted_keys=only_keys)
+            # 按列拆成两侧取值：主键字段 + 其他字段（结果列 src_/tgt_ 去掉前缀）
+            fields = [f for f in all_fields if not self.rules[f].get("is_primary")]
+            pk_frame = result_df[self.primary_keys]
+            source = pd.concat([pk_frame, result_df[[f"src_{f}" for f in fields]].set_axis(fields, axis=1)], axis=1)
+            target = pd.concat([pk_frame, result_df[[f"tgt_{f}" for f in fields]].set_axis(fields, axis=1)], axis=1)
+
+            # 特别处理资产明细类别字段
+            if "资产分类" in self.rules:
+                target["资产明细类别"] = result_df["tgt_资产明细类别"]
+                source[CATEGORY_CODE_COLUMN] = result_df[CATEGORY_CODE_COLUMN]
+
+            flags = result_df[[f"diff_{f}" for f in diff_conditions]].fillna(0).astype(int).to_numpy() != 0
+            self._diff_keys = set(result_df[PK_COLUMN]) if not result_df.empty else set()
+            return DiffTable(result_df[PK_COLUMN].to_numpy(), source, target, flags, list(diff_conditions))
 
-                    diff_records.append({
-                        "source": src_data,
-                        "target": tgt_data
-                    })
+        except Exception as e:
+            # 上抛由 run() 报告失败，不能当作没有差异（内存引擎遇到同样的问题也会抛出）
+            raise Exception(f"数据库对比失败: {e}")
+
+    # ---------- 导入仓库（增量比对） ----------
+    def _import_signature(self, is_file1):
+        """影响导入结果的规则参数，参与内容指纹计算：规则或映射变化后不会复用旧的导入"""
+        return json.dumps({
+            "rules": {k: dict(v) for k, v in self.rules.items()},
+            "primary_keys": list(self.primary_keys),
+            "category_mapping": sorted(self.artifacts.category_mapping.items()) if is_file1 else None,
+            "numeric_type": numeric_sql_type(),
+        }, ensure_ascii=False, sort_keys=True, default=str)
+
+    def _source(self, is_file1):
+        """导入来源：同一文件同一工作表的历次导入归为一个来源"""
+        if is_file1:
+            return f"表一|{self.sheet_name1}|{os.path.abspath(self.file1)}"
+        return f"表二|{self.sheet_name2}|{os.path.abspath(self.file2)}"
 
-            return diff_records
+    def _run_source(self):
+        """比对来源：两侧来源与规则都相同的比对才能互相复用结论"""
+        parts = [self._source(True), self._source(False), self._import_signature(True),
+                 self._import_signature(False), str(self.skip_rows)]
+        return hashlib.sha256("\x1f".join(parts).encode('utf-8')).hexdigest()
 
-        except Exception as e:
-            self.log_signal.emit(f"数据库对比出错：{str(e)}")
-            return []
+    def _sheet(self, is_file1):
+        """(文件, 页签, 跳过行数)"""
+        if is_file1:
+            return self.file1, self.sheet_name1, 0
+        return self.file2, self.sheet_name2, self.skip_rows
+
+    def _import_job(self, is_file1, table, computed_columns):
+        """一侧导入数据库的任务：(函数, 关键字参数)，参数均可序列化，供子进程执行"""
+        file_path, sheet_name, skip_rows = self._sheet(is_file1)
+        return import_excel_to_db, dict(
+            file_path=file_path, sheet_name=sheet_name, table_name=table,
+            is_file1=is_file1, skip_rows=skip_rows, chunk_size=self.chunk_size,
+            column_types=self._column_types(is_file1=is_file1),
+            computed_columns=computed_columns, index_columns=[PK_COLUMN]
+        )
+
+    def _run_sides(self, jobs, parallel=True):
+        """
+        两侧任务各在一个子进程中并行执行（解析与写库互相重叠），返回 {is_file1: 结果}
+        子进程每处理一块回传行数，按页签估算的总行数折算进度，每侧各占导入阶段的一半
+        并行时两侧平分分片解析的进程数，总数不超过 CPU 核数
+        任务返回 (结果, 无法识别的单元格数)，后者在此写入日志
+        """
+        workers = parse_workers(len(jobs) if parallel else 1)
+        jobs = {is_file1: (func, dict(kwargs, workers=workers)) for is_file1, (func, kwargs) in jobs.items()}
+        fractions = {True: 1.0, False: 1.0}  # 不需要导入（复用）的一侧视为已完成
+        totals = {}
+        for is_file1 in jobs:
+            file_path, sheet_name, skip_rows = self._sheet(is_file1)
+            fractions[is_file1] = 0.0
+            totals[is_file1] = estimate_sheet_rows(file_path, sheet_name)
+
+        def on_progress(is_file1, rows):
+            total = totals.get(is_file1)
+            if total:
+                fractions[is_file1] = min(rows / total, 1.0)
+                self.progress_signal.emit(int(_IMPORT_PROGRESS * sum(fractions.values()) / 2))
+
+        results = run_sides(jobs, progress=on_progress, parallel=parallel,
+                            setup=apply_engine_settings, setup_args=(engine_settings(),))
+        self.progress_signal.emit(_IMPORT_PROGRESS)
+        self._log_coerced({is_file1: coerced for is_file1, (_, coerced) in results.items()})
+        return {is_file1: value for is_file1, (value, _) in results.items()}
+
+    def _log_coerced(self, coerced_by_side):
+        """数值/日期列中无法识别的值按空值入库，两侧都无法识别时会被判为一致，逐列提示数量"""
+        for is_file1, label in ((True, "平台表"), (False, "ERP表")):
+            types = {sanitize_column_name(c): t for c, t in self._column_types(is_file1).items()}
+            for column, count in coerced_by_side.get(is_file1, {}).items():
+                data_type = types.get(column, "数值/日期")
+                self.log_signal.emit(f"⚠️ {label}列「{column}」有 {count} 个值无法识别为{data_type}，已按空值比对")
+
+    def _log_imported(self, rows_by_side, start_time, verb="导入"):
+        for is_file1, label in ((True, "平台表"), (False, "ERP表")):
+            if is_file1 in rows_by_side:
+                rows = rows_by_side[is_file1]
+                self.log_signal.emit(f"✅ {label}{verb}完成，共 {rows} 行，{self._throughput(rows, start_time)}")
+
+    def _load_into_store(self):
+        """经导入仓库加载两表：未变化的一侧直接复用上次导入，变化的一侧并行导入，返回值同 _load_into_mysql"""
+        imports, jobs = {}, {}
+        for is_file1, label in ((True, "平台表"), (False, "ERP表")):
+            file_path, sheet_name, skip_rows = self._sheet(is_file1)
+            fingerprint = fingerprint_sheet(file_path, sheet_name, skip_rows, is_file1,
+                                            self._import_signature(is_file1))
+            hit = find_import(fingerprint)
+            if hit:
+                table, rows = hit
+                register_import(fingerprint, self._source(is_file1), table, rows)  # 刷新为该来源最近一次导入
+                self.log_signal.emit(f"♻️ {label}内容未变化，复用上次导入的数据，共 {rows} 行")
+            else:
+                table, rows = store_table_name(fingerprint), None
+                execute_query(f"DROP TABLE IF EXISTS `{table}`")  # 上次导入中途失败留下的残表
+                computed_columns = self._computed_columns(is_file1)
+                computed_columns[ROW_HASH_COLUMN] = ("CHAR(16)", row_hash_series)
+                jobs[is_file1] = self._import_job(is_file1, table, computed_columns)
+            imports[is_file1] = [fingerprint, table, rows]
+
+        t_import = time.time()
+        imported = self._run_sides(jobs, parallel=supports_multiprocess())
+        self._log_imported(imported, t_import)
+        for is_file1, rows in imported.items():
+            fingerprint, table, _ = imports[is_file1]
+            imports[is_file1][2] = rows
+            if not is_file1:
+                self._add_calculated_fields(table, is_file1=False)
+            register_import(fingerprint, self._source(is_file1), table, rows)
+
+        (fp1, self.table1, rows1), (fp2, self.table2, rows2) = imports[True], imports[False]
+        self._fingerprints = (fp1, fp2)
+        return rows1, rows2
+
+    def _incremental_keys(self, common_count):
+        """
+        增量比对需要重比的主键：两侧相对上次比对行哈希变化的主键 + 上次判定有差异的主键
+        其余共同主键两侧内容都与上次相同，结论必然仍是一致；没有可用的上次比对时返回 None（全量比对）
+        """
+        if not self._fingerprints:
+            return None
+        previous = latest_compare_run(self._run_source())
+        if previous is None:
+            return None
+        old_fp1, old_fp2, keys = previous
+        for old_fp, new_fp, table in ((old_fp1, self._fingerprints[0], self.table1),
+                                      (old_fp2, self._fingerprints[1], self.table2)):
+            if old_fp != new_fp:
+                keys |= changed_keys(store_table_name(old_fp), table)
+        if len(keys) > common_count // 2:
+            return None  # 变化的行过多时，全量比对比按键表 JOIN 更快
+        self.log_signal.emit(f"♻️ 增量比对：仅重比 {len(keys)} 个变化或上次存在差异的主键")
+        return keys
+
+    def _load_into_mysql(self):
+        """导入两表到 MySQL 临时表并补齐映射表、计算字段，返回 (表一行数, 表二行数)"""
+        if self.incremental:
+            return self._load_into_store()
+
+        # 1. 两表并行导入
+        t_import = time.time()
+        rows = self._run_sides({
+            True: self._import_job(True, TEMP_TABLE1, self._computed_columns(is_file1=True)),
+            False: self._import_job(False, TEMP_TABLE2, self._computed_columns(is_file1=False)),
+        }, parallel=supports_multiprocess())
+        self._log_imported(rows, t_import)
+
+        # 2/3. _pk_concat 已在导入时计算并建好索引
+
+        # 4. 为表二添加计算字段
+        self._add_calculated_fields(TEMP_TABLE2, is_file1=False)
+        return rows[True], rows[False]
+
+    def _load_in_memory(self):
+        """内存引擎：两表并行读成 DataFrame 并补齐计算字段，返回值同 _load_into_mysql"""
+        jobs = {}
+        for is_file1 in (True, False):
+            file_path, sheet_name, skip_rows = self._sheet(is_file1)
+            jobs[is_file1] = (memory_comparator.load_sheet, dict(
+                file_path=file_path, sheet_name=sheet_name,
+                column_types=self._column_types(is_file1=is_file1),
+                computed_columns=self._computed_columns(is_file1=is_file1),
+                is_file1=is_file1, skip_rows=skip_rows, chunk_size=self.chunk_size
+            ))
+        t_import = time.time()
+        frames = self._run_sides(jobs)
+        df1, df2 = frames[True], frames[False]
+        self._log_imported({True: len(df1), False: len(df2)}, t_import, verb="读取")
+
+        memory_comparator.add_calculated_fields(df2, self.rules)
+        self._frames = (df1, df2)
+        return len(df1), len(df2)
+
+    def _compare_fields_in_memory(self):
+        """内存引擎的字段差异比对，返回结构同 _compare_fields_in_db"""
+        df1, df2 = self._frames
+        return memory_comparator.compare_fields(df1, df2, self.rules, self.primary_keys)
 
     # ---------- 主流程 ----------
     def run(self):
         try:
-            self.log_signal.emit("正在初始化数据库...")
             time0 = time.time()
-
-            if not init_database():
-                self.log_signal.emit("❌ 数据库初始化失败")
-                return
-
-            # 1. 导入数据
-            rows1 = import_excel_to_db(
-                self.file1, self.sheet_name1, TEMP_TABLE1,
-                is_file1=True, chunk_size=self.chunk_size
-            )
-            self.log_signal.emit(f"✅ 平台表导入完成，共 {rows1} 行")
-
-            rows2 = import_excel_to_db(
-                self.file2, self.sheet_name2, TEMP_TABLE2,
-                is_file1=False, skip_rows=self.skip_rows, chunk_size=self.chunk_size
-            )
-            self.log_signal.emit(f"✅ ERP表导入完成，共 {rows2} 行")
-
-            # 预先准备资产分类映射表数据
-            mapping_prepared = prepare_asset_category_mapping(self.rules, self.rule_file)
-            if mapping_prepared:
-                self.log_signal.emit("✅ 资产分类映射表准备完成")
-
-            # 2. 建索引
-            create_compare_index(TEMP_TABLE1, ["_pk_concat"])
-            create_compare_index(TEMP_TABLE2, ["_pk_concat"])
-
-            # 3. 生成 _pk_concat
-            expr1 = self._build_pk_expr("t1", is_file1=True)
-            expr2 = self._build_pk_expr("t2", is_file1=False)
-            self._add_concat_pk_column(TEMP_TABLE1, expr1)
-            self._add_concat_pk_column(TEMP_TABLE2, expr2)
-
-            # 4. 为表二添加计算字段
-            self._add_calculated_fields(TEMP_TABLE2, is_file1=False)
-
-            # 5. SQL 计算共同/缺失/多余
-            diff_df = self._diff_by_mysql()
-            common_str = diff_df.at[0, 'common_keys'] or ''
-            missing_str = diff_df.at[0, 'missing_keys'] or ''
-            extra_str = diff_df.at[0, 'extra_keys'] or ''
-
-            common_codes = set(common_str.split('||')) if common_str else set()
-            missing_in_file2 = set(missing_str.split('||')) if missing_str else set()
-            missing_in_file1 = set(extra_str.split('||')) if extra_str else set()
-
-            # 6. 拉取缺失/多余行
-            if missing_in_file2:
-                self.missing_rows = fetch_rows_by_pk(
-                    TEMP_TABLE1, ["_pk_concat"], missing_in_file2
-                ).to_dict(orient='records')
-            if missing_in_file1:
-                self.extra_in_file2 = fetch_rows_by_pk(
-                    TEMP_TABLE2, ["_pk_concat"], missing_in_file1
-                ).to_dict(orient='records')
+            if self.backend == BACKEND_MEMORY:
+                rows1, rows2 = self._load_in_memory()
+            else:
+                self.log_signal.emit("正在初始化数据库...")
+                set_db_engine('sqlite' if self.backend == BACKEND_SQLITE else 'mysql')
+                if not init_database():
+                    self.log_signal.emit("❌ 数据库初始化失败")
+                    return
+                rows1, rows2 = self._load_into_mysql()
+
+            # 5. 计算共同/缺失/多余，并拉取缺失/多余行
+            if self.backend == BACKEND_MEMORY:
+                df1, df2 = self._frames
+                common_codes, missing_in_file2, missing_in_file1 = memory_comparator.classify_keys(df1, df2)
+                self.missing_rows = memory_comparator.rows_by_keys(df1, missing_in_file2)
+                self.extra_in_file2 = memory_comparator.rows_by_keys(df2, missing_in_file1)
+            else:
+                common_codes, missing_in_file2, missing_in_file1 = self._diff_by_mysql()
+                if missing_in_file2:
+                    self.missing_rows = RowTable(fetch_rows_by_pk(
+                        self.table1, ["_pk_concat"], missing_in_file2
+                    ))
+                if missing_in_file1:
+                    self.extra_in_file2 = RowTable(fetch_rows_by_pk(
+                        self.table2, ["_pk_concat"], missing_in_file1
+                    ))
+            self.progress_signal.emit(90)
 
             # 显示缺失和多余的主键信息
             if self.missing_rows:
@@ -564,8 +628,14 @@ class CompareWorker(QThread):
                 self.log_signal.emit("警告：两个文件中没有共同的主键！")
                 return
 
-            # 7. 在数据库中进行字段差异比对
-            diff_full_rows = self._compare_fields_in_db(common_codes)
+            # 7. 字段差异比对
+            if self.backend == BACKEND_MEMORY:
+                diff_full_rows = self._compare_fields_in_memory()
+            else:
+                diff_full_rows = self._compare_fields_in_db(
+                    common_codes, only_keys=self._incremental_keys(len(common_codes)))
+                if self._fingerprints and self._diff_keys is not None:
+                    save_compare_run(*self._fingerprints, self._run_source(), self._diff_keys)
             diff_count = len(diff_full_rows)
 
             # 8. 构建结果摘要
@@ -573,6 +643,7 @@ class CompareWorker(QThread):
             primary_key_str = " + ".join(self.primary_keys)
 
             self.diff_full_rows = diff_full_rows
+            self.result_index = ResultIndex.build(self.rules, diff_full_rows, self.missing_rows, self.extra_in_file2)
             self.summary = {
                 "primary_key": primary_key_str,
                 "total_file1": rows1,
@@ -599,173 +670,27 @@ class CompareWorker(QThread):
                     pk_str = " + ".join(pk_values)
                     self.log_signal.emit(f"  {i + 1}. 主键: {pk_str}")
 
-                    # 查找并显示具体差异的字段
-                    for field_name, rule in self.rules.items():
-                        if rule.get("is_primary"):
-                            continue  # 跳过主键字段
-
-                        src_value = src.get(field_name, "")
-                        tgt_value = tgt.get(field_name, "")
-
-                        # 获取目标表中的正确字段名
-                        if rule.get("calc_rule") and rule.get("data_type") in ["数值", "文本"]:
-                            tgt_value = tgt.get(field_name, "")
-                        else:
-                            table2_field = rule.get("table2_field", field_name)
-                            tgt_value = tgt.get(table2_field, "") or tgt.get(field_name, "")
-
-                        # 标准化值用于比较
-                        norm_src = self.normalize_value(src_value)
-                        norm_tgt = self.normalize_value(tgt_value)
-
-                        # 对于日期字段，需要特殊处理格式
-                        if rule.get("data_type") == "日期":
-                            norm_src = self._normalize_date_format(norm_src)
-                            norm_tgt = self._normalize_date_format(norm_tgt)
-
-                        # 对于数值字段，考虑精度处理
-                        elif rule.get("data_type") == "数值":
-                            tail_diff = int(rule.get("tail_diff", 0))
-                            try:
-                                # 尝试转换为数值并按精度比较
-                                src_num = float(norm_src) if norm_src else 0
-                                tgt_num = float(norm_tgt) if norm_tgt else 0
-
-                                # 如果设置了尾差，则按尾差精度比较
-                                if tail_diff > 0:
-                                    src_rounded = round(src_num, tail_diff)
-                                    tgt_rounded = round(tgt_num, tail_diff)
-
-                                    # 只有在超出尾差范围时才显示为差异
-                                    if abs(src_rounded - tgt_rounded) > (10 ** (-tail_diff)):
-                                        # 格式化显示值，保持精度一致性
-                                        src_display = f"{src_num:.{tail_diff}f}" if norm_src else ""
-                                        tgt_display = f"{tgt_num:.{tail_diff}f}" if norm_tgt else ""
-                                        self.log_signal.emit(
-                                            f"    - {field_name}: 表一='{src_display}' ≠ 表二='{tgt_display}'")
-                                else:
-                                    # 没有设置尾差时，直接比较数值
-                                    if src_num != tgt_num:
-                                        self.log_signal.emit(
-                                            f"    - {field_name}: 表一='{src_value}' ≠ 表二='{tgt_value}'")
-                            except (ValueError, TypeError):
-                                # 如果不能转换为数值，按字符串比较
-                                if norm_src != norm_tgt:
-                                    self.log_signal.emit(f"    - {field_name}: 表一='{src_value}' ≠ 表二='{tgt_value}'")
-
-                        # 对于文本字段，需要特殊处理标准化
-                        elif rule.get("data_type") == "文本":
-                            # 特殊处理资产分类字段
-                            if field_name == "资产分类":
-                                if mapping_prepared:
-                                    # 获取映射表
-                                    mapping_df = _load_asset_category_mapping(self.rule_file)
-                                    if not mapping_df.empty and '同源目录完整名称' in mapping_df.columns and '同源目录编码' in mapping_df.columns:
-                                        # 创建映射字典
-                                        category_mapping = dict(zip(mapping_df['同源目录完整名称'].astype(str),
-                                                                    mapping_df['同源目录编码'].astype(str)))
-
-                                        # 获取表一的编码（通过映射）
-                                        src_code = category_mapping.get(str(src_value), str(src_value))
-                                        src_code_prefix = src_code[:2] if len(src_code) >= 2 else src_code
-
-                                        # 获取表二的"资产明细类别"字段值（实际用于对比的字段）
-                                        actual_tgt_value = tgt.get("资产明细类别", "")
-                                        tgt_code_prefix = str(actual_tgt_value)[:2] if len(
-                                            str(actual_tgt_value)) >= 2 else str(actual_tgt_value)
-
-                                        # 比较前两位
-                                        if src_code_prefix != tgt_code_prefix:
-                                            # 显示原始中文信息而不是编码
-                                            self.log_signal.emit(
-                                                f"    - {field_name}: 表一='{src_value}' ≠ 表二='{actual_tgt_value}' (编码前两位不匹配: {src_code_prefix} vs {tgt_code_prefix})")
-                                    else:
-                                        # 映射表不可用时的回退处理
-                                        norm_src_text = self._normalize_text_value(src_value)
-                                        norm_tgt_text = self._normalize_text_value(tgt_value)
-                                        if norm_src_text != norm_tgt_text:
-                                            self.log_signal.emit(
-                                                f"    - {field_name}: 表一='{src_value}' ≠ 表二='{tgt_value}'")
-                                else:
-                                    # 映射表未准备好的回退处理
-                                    norm_src_text = self._normalize_text_value(src_value)
-                                    norm_tgt_text = self._normalize_text_value(tgt_value)
-                                    if norm_src_text != norm_tgt_text:
-                                        self.log_signal.emit(
-                                            f"    - {field_name}: 表一='{src_value}' ≠ 表二='{tgt_value}'")
-                            # 特殊处理监管资产属性字段，只对比二级分类
-                            elif field_name == "监管资产属性":
-                                # 提取二级分类进行比较
-                                src_second_level = self._extract_second_level(str(src_value))
-                                tgt_second_level = self._extract_second_level(str(tgt_value))
-
-                                if src_second_level != tgt_second_level:
-                                    self.log_signal.emit(
-                                        f"    - {field_name}: 表一='{src_value}' ≠ 表二='{tgt_value}' (二级分类不匹配: '{src_second_level}' vs '{tgt_second_level}')")
-                            # 对折旧方法字段进行特殊处理
-                            elif "折旧方法" in field_name:
-                                norm_src_text = self._normalize_depreciation_method(src_value, is_file1=True)
-                                norm_tgt_text = self._normalize_depreciation_method(tgt_value, is_file1=False)
-                                # 比较标准化后的值
-                                if norm_src_text != norm_tgt_text:
-                                    self.log_signal.emit(f"    - {field_name}: 表一='{src_value}' ≠ 表二='{tgt_value}'")
-                            else:
-                                # 对其他文本值进行标准化处理
-                                norm_src_text = self._normalize_text_value(src_value)
-                                norm_tgt_text = self._normalize_text_value(tgt_value)
-                                # 比较标准化后的值
-                                if norm_src_text != norm_tgt_text:
-                                    self.log_signal.emit(f"    - {field_name}: 表一='{src_value}' ≠ 表二='{tgt_value}'")
-                        else:
-                            # 其他类型按原逻辑比较
-                            if norm_src != norm_tgt:
-                                self.log_signal.emit(f"    - {field_name}: 表一='{src_value}' ≠ 表二='{tgt_value}'")
+                    # 显示判定不一致的字段
+                    for field_name in diff_record["diff_fields"]:
+                        self.log_signal.emit(f"    - {self._describe_field_diff(field_name, src, tgt)}")
                 if diff_count > 10:
                     self.log_signal.emit(f"  ... 还有 {diff_count - 10} 条差异记录未显示")
 
             time1 = time.time()
+            self.progress_signal.emit(100)
             self.log_signal.emit(f"✅ 对比完成，总耗时{time1 - time0:.1f}s")
 
         except Exception as e:
             logging.error(traceback.format_exc())
             self.log_signal.emit(f"❌ 发生错误：{str(e)}")
         finally:
-            try:
-                drop_tables()
-            except:
-                pass
+            if self.backend == BACKEND_MEMORY:
+                self._frames = None
+            else:
+                try:
+                    drop_tables()
+                except:
+                    pass
             gc.collect()
             self.quit()
             self.wait()
-
-    def _normalize_date_format(self, date_str):
-        """
-        标准化日期格式
-        支持 '2019-12-19' 和 '20191219' 等格式
-        """
-        if not date_str:
-            return ""
-
-        # 移除所有非数字字符，获取纯数字
-        digits = re.sub(r'\D', '', date_str)
-
-        # 如果是8位数字，假设为 YYYYMMDD 格式
-        if len(digits) == 8:
-            try:
-                return f"{digits[:4]}-{digits[4:6]}-{digits[6:8]}"
-            except:
-                return date_str  # 如果转换失败，返回原始值
-
-        # 如果已经包含连字符，尝试标准化
-        if '-' in date_str:
-            try:
-                parts = date_str.split('-')
-                if len(parts) == 3:
-                    year, month, day = parts
-                    return f"{year}-{int(month):02d}-{int(day):02d}"
-            except:
-                return date_str  # 如果转换失败，返回原始值
-
-        # 其他情况返回原始值
-        return date_str
-
@@ -1,4 +1,10 @@
+import os
 import re
+import json
+import shutil
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 from PyQt5.QtCore import QThread, pyqtSignal
 from openpyxl import load_workbook
@@ -6,6 +12,13 @@ import xlrd
 import gc
 import zipfile
 import xml.etree.ElementTree as ET
+from datetime import datetime, time, timedelta
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # 未安装 pyarrow 时不使用解析结果缓存
+    pa = None
 
 class LoadColumnWorker(QThread):
     """用于在独立线程中读取Excel列名和页签"""
@@ -44,122 +57,546 @@ class LoadColumnWorker(QThread):
             self.error_occurred.emit(f"读取页签失败: {str(e)}")
 
 
+# ---------------------------------------------------------
+# xlsx 流式读取：直接解析页签 XML，不经过 openpyxl 全量加载
+# ---------------------------------------------------------
+_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+_PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+# Excel 内置的日期/时间格式编号（含中文区域设置下的 27-36、50-58）
+_BUILTIN_DATE_FMT_IDS = set(range(14, 23)) | set(range(27, 37)) | set(range(45, 48)) | set(range(50, 59))
+_DATE_FMT_STRIP_RE = re.compile(r'\[(?!(?:hh?|mm?|ss?)\])[^\]]*\]|"[^"]*"|\\.')
+_DATE_FMT_RE = re.compile(r'(?<![_\\])[dmhysDMHYS]')
+_CELL_REF_RE = re.compile(r'([A-Z]+)(\d+)')
+_ROW_END_TAG_RE = re.compile(rb'</(?:\w+:)?$')
+_SHEET_DATA_END_RE = re.compile(rb'</(?:\w+:)?sheetData>')
+
+# 分片并行解析：页签 XML（解压后）超过 SHARD_MIN_BYTES 时，按 SHARD_BYTES 切成若干段整行交给子进程解码
+PARSE_WORKERS = os.cpu_count() or 1
+SHARD_MIN_BYTES = 32 << 20
+SHARD_BYTES = 4 << 20
+
+
+def parse_workers(sides=1):
+    """每侧可用的分片解析进程数：sides 个页签同时解析时平分 PARSE_WORKERS，避免总进程数超过 CPU 核数"""
+    return max(1, PARSE_WORKERS // max(1, sides))
+
+
+def _local(tag):
+    """去掉命名空间，只保留标签本地名"""
+    return tag.rsplit('}', 1)[-1]
+
+
+def _col_index(letters):
+    """'A' -> 1, 'AB' -> 28"""
+    idx = 0
+    for ch in letters:
+        idx = idx * 26 + ord(ch) - 64
+    return idx
+
+
+def _parse_range(ref):
+    """'A1:D2' -> (min_col, min_row, max_col, max_row)，与 openpyxl 的 bounds 一致"""
+    parts = ref.split(':')
+    start = _CELL_REF_RE.match(parts[0])
+    end = _CELL_REF_RE.match(parts[-1])
+    return (_col_index(start.group(1)), int(start.group(2)),
+            _col_index(end.group(1)), int(end.group(2)))
+
+
+class _CellDecoder:
+    """单元格解码：共享字符串与日期样式只加载一次，可整体传给分片解析的子进程"""
+
+    def __init__(self, shared_strings, date_styles, date1904):
+        self.shared_strings = shared_strings
+        self.date_styles = date_styles
+        self.date1904 = date1904
+
+    def from_excel_date(self, value):
+        if self.date1904:
+            return datetime(1904, 1, 1) + timedelta(days=value)
+        if 0 < value < 60:
+            # Excel 1900 年闰年 bug：60 之前的序号少算一天
+            value += 1
+        dt = datetime(1899, 12, 30) + timedelta(days=value)
+        if value < 1:
+            return dt.time()
+        return dt
+
+    def decode_cell(self, c):
+        cell_type = c.attrib.get('t', 'n')
+        raw = None
+        for child in c:
+            name = _local(child.tag)
+            if name == 'v':
+                raw = child.text
+                break
+            if name == 'is':
+                return ''.join(t.text or '' for t in child.iter() if _local(t.tag) == 't')
+        if raw is None:
+            return None
+        if cell_type == 's':
+            return self.shared_strings[int(raw)]
+        if cell_type == 'n':
+            if '.' in raw or 'E' in raw or 'e' in raw:
+                value = float(raw)
+            else:
+                value = int(raw)
+            style = c.attrib.get('s')
+            if style is not None and int(style) in self.date_styles:
+                return self.from_excel_date(value)
+            return value
+        if cell_type == 'b':
+            return raw == '1'
+        if cell_type == 'd':
+            return datetime.fromisoformat(raw.rstrip('Z'))
+        # str / e
+        return raw
+
+    def decode_row(self, el):
+        """<row> 元素 -> 值元组，缺失的单元格补 None"""
+        values = []
+        next_col = 1
+        for c in el:
+            ref = c.attrib.get('r')
+            col = _col_index(_CELL_REF_RE.match(ref).group(1)) if ref else next_col
+            if col > next_col:
+                values.extend([None] * (col - next_col))
+            values.append(self.decode_cell(c))
+            next_col = col + 1
+        return tuple(values)
+
+
+_shard_decoder = None  # 分片解析子进程内的解码器，由 _init_shard_worker 设置
+
+
+def _init_shard_worker(decoder):
+    global _shard_decoder
+    _shard_decoder = decoder
+
+
+def _decode_shard(wrapper, fragment):
+    """子进程解码一段整行 XML，返回 [(行号或 None, 值元组), ...]"""
+    root = ET.fromstring(wrapper[0] + fragment + wrapper[1])
+    rows = []
+    for el in root.iter():
+        if _local(el.tag) == 'row':
+            r = el.attrib.get('r')
+            rows.append((int(r) if r else None, _shard_decoder.decode_row(el)))
+    return rows
+
+
+def _last_row_end(buf, limit=None):
+    """buf[:limit] 中最后一个 </row>（可带命名空间前缀）之后的位置，没有则返回 -1"""
+    pos = buf.rfind(b'row>', 0, len(buf) if limit is None else limit)
+    while pos >= 0:
+        lt = buf.rfind(b'<', max(0, pos - 32), pos)
+        if lt >= 0 and _ROW_END_TAG_RE.match(buf, lt, pos):
+            return pos + 4
+        pos = buf.rfind(b'row>', 0, pos)
+    return -1
+
+
+class XlsxStreamReader:
+    """
+    流式读取 .xlsx 单个页签
+    1. 页签路径、共享字符串、日期样式只解析一次
+    2. 合并单元格只扫描 </sheetData> 之后的尾部，不解析数据区
+    3. 数据行用 iterparse 逐行解码，按批返回，内存占用只与批大小有关
+    4. 大页签可按整行切片交给多个子进程并行解码，结果按原顺序拼回
+    """
 
+    def __init__(self, file_path, sheet_name):
+        self.file_path = file_path
+        self.sheet_name = sheet_name
+        self._zf = zipfile.ZipFile(file_path, 'r')
+        try:
+            self.sheet_path, self._date1904 = self._resolve_sheet_path()
+            self.shared_strings = self._load_shared_strings()
+            self.date_styles = self._load_date_styles()
+            self.decoder = _CellDecoder(self.shared_strings, self.date_styles, self._date1904)
+        except Exception:
+            self._zf.close()
+            raise
+        self.dimension_cols = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._zf.close()
+
+    # ---------- 元数据 ----------
+    def _resolve_sheet_path(self):
+        """根据 workbook.xml + rels 找到页签对应的 sheetN.xml"""
+        root = ET.fromstring(self._zf.read('xl/workbook.xml'))
+        date1904 = False
+        rel_id = None
+        for el in root.iter():
+            name = _local(el.tag)
+            if name == 'workbookPr':
+                date1904 = el.attrib.get('date1904') in ('1', 'true')
+            elif name == 'sheet' and el.attrib.get('name') == self.sheet_name:
+                rel_id = el.attrib.get(f'{{{_REL_NS}}}id')
+        if rel_id is None:
+            raise ValueError(f"未找到页签: {self.sheet_name}")
+
+        rels = ET.fromstring(self._zf.read('xl/_rels/workbook.xml.rels'))
+        for rel in rels.findall(f'{{{_PKG_REL_NS}}}Relationship'):
+            if rel.attrib.get('Id') == rel_id:
+                target = rel.attrib['Target']
+                path = target.lstrip('/') if target.startswith('/') else f"xl/{target}"
+                return path, date1904
+        raise ValueError(f"页签 {self.sheet_name} 缺少对应的工作表文件")
+
+    def _load_shared_strings(self):
+        """iterparse 读取共享字符串，富文本拼接各段，忽略拼音注音(rPh)"""
+        if 'xl/sharedStrings.xml' not in self._zf.namelist():
+            return []
+        strings = []
+        with self._zf.open('xl/sharedStrings.xml') as fh:
+            for _, el in ET.iterparse(fh, events=('end',)):
+                if _local(el.tag) != 'si':
+                    continue
+                parts = []
+                for child in el:
+                    name = _local(child.tag)
+                    if name == 't':
+                        parts.append(child.text or '')
+                    elif name == 'r':
+                        for t in child:
+                            if _local(t.tag) == 't':
+                                parts.append(t.text or '')
+                strings.append(''.join(parts))
+                el.clear()
+        return strings
+
+    def _load_date_styles(self):
+        """返回属于日期格式的单元格样式下标集合"""
+        if 'xl/styles.xml' not in self._zf.namelist():
+            return set()
+        root = ET.fromstring(self._zf.read('xl/styles.xml'))
+        custom = {}
+        date_styles = set()
+        for el in root:
+            name = _local(el.tag)
+            if name == 'numFmts':
+                for fmt in el:
+                    custom[int(fmt.attrib['numFmtId'])] = fmt.attrib.get('formatCode', '')
+            elif name == 'cellXfs':
+                for idx, xf in enumerate(el):
+                    fmt_id = int(xf.attrib.get('numFmtId', 0))
+                    if fmt_id in custom:
+                        code = _DATE_FMT_STRIP_RE.sub('', custom[fmt_id].split(';')[0])
+                        if _DATE_FMT_RE.search(code):
+                            date_styles.add(idx)
+                    elif fmt_id in _BUILTIN_DATE_FMT_IDS:
+                        date_styles.add(idx)
+        return date_styles
+
+    def merged_ranges(self):
+        """
+        读取合并单元格 (min_col, min_row, max_col, max_row)
+        mergeCells 位于 </sheetData> 之后，按块扫描字节流，只解析尾部
+        """
+        marker = b'</sheetData>'
+        tail = None
+        buf = b''
+        with self._zf.open(self.sheet_path) as fh:
+            while True:
+                block = fh.read(1 << 20)
+                if not block:
+                    break
+                if tail is not None:
+                    tail += block
+                    continue
+                buf = buf[-len(marker):] + block
+                pos = buf.find(marker)
+                if pos >= 0:
+                    tail = buf[pos + len(marker):]
+        if not tail:
+            return []
+        return [_parse_range(ref.decode('utf-8'))
+                for ref in re.findall(rb'<(?:\w+:)?mergeCell\s[^>]*?ref="([^"]+)"', tail)]
+
+    def dimension_rows(self):
+        """页签 <dimension> 记录的最大行号（只读开头一小段 XML），缺失时返回 None"""
+        with self._zf.open(self.sheet_path) as fh:
+            head = fh.read(1 << 16)
+        match = re.search(rb'<(?:\w+:)?dimension\s[^>]*?ref="([^"]+)"', head)
+        if not match or b':' not in match.group(1):
+            return None
+        return _parse_range(match.group(1).decode('utf-8'))[3]
+
+    # ---------- 数据行 ----------
+    def iter_rows(self, min_row=1, max_row=None):
+        """
+        逐行产出 (行号, 值元组)，行号从 1 开始
+        行之间的空洞补成空元组，与 openpyxl.iter_rows 行为一致
+        """
+        expected = min_row
+        with self._zf.open(self.sheet_path) as fh:
+            parent = None
+            for event, el in ET.iterparse(fh, events=('start', 'end')):
+                name = _local(el.tag)
+                if event == 'start':
+                    if name == 'sheetData':
+                        parent = el
+                    elif name == 'dimension' and self.dimension_cols is None:
+                        ref = el.attrib.get('ref', '')
+                        if ':' in ref:
+                            self.dimension_cols = _parse_range(ref)[2]
+                    continue
+                if name != 'row':
+                    continue
+
+                row_idx = int(el.attrib.get('r', expected))
+                if row_idx >= min_row:
+                    if max_row is not None and row_idx > max_row:
+                        break
+                    values = self.decoder.decode_row(el)
+                    while expected < row_idx:
+                        yield expected, ()
+                        expected += 1
+                    yield row_idx, values
+                    expected = row_idx + 1
+
+                el.clear()
+                if parent is not None:
+                    parent.remove(el)
+
+    def read_header(self, max_rows=2):
+        """读取前 max_rows 行表头，按页签列宽补齐"""
+        rows = [values for _, values in self.iter_rows(1, max_rows)]
+        width = max([self.dimension_cols or 0] + [len(r) for r in rows])
+        return [tuple(r) + (None,) * (width - len(r)) for r in rows]
+
+    def sheet_size(self):
+        """页签 XML 解压后的字节数"""
+        return self._zf.getinfo(self.sheet_path).file_size
+
+    def _iter_fragments(self, shard_bytes):
+        """
+        顺序解压页签 XML，按 </row> 边界切成约 shard_bytes 的片段
+        返回 ((根元素开始标签, 结束标签), 片段生成器)：片段包在根元素里解析，行上带前缀的属性才有命名空间声明
+        """
+        fh = self._zf.open(self.sheet_path)
+        head = b''
+        while True:
+            block = fh.read(1 << 16)
+            head += block
+            start = re.search(rb'<(?:\w+:)?sheetData\b[^>]*?(/?)>', head)
+            if start or not block:
+                break
+        root = re.search(rb'<((?:\w+:)?)worksheet\b[^>]*>', head)
+        if not start or not root or start.group(1):
+            fh.close()
+            return (b'', b''), iter(())
+        wrapper = (root.group(0), b'</' + root.group(1) + b'worksheet>')
+
+        def fragments():
+            with fh:
+                buf = head[start.end():]
+                scanned, finished = 0, False
+                while True:
+                    end = _SHEET_DATA_END_RE.search(buf, max(0, scanned - 16))
+                    if end:
+                        buf, finished = buf[:end.start()], True
+                    while len(buf) >= shard_bytes:
+                        # 单行超过片段大小时退而在整段内找行尾
+                        cut = _last_row_end(buf, shard_bytes)
+                        cut = cut if cut > 0 else _last_row_end(buf)
+                        if cut <= 0:
+                            break
+                        yield buf[:cut]
+                        buf = buf[cut:]
+                    scanned = len(buf)
+                    block = b'' if finished else fh.read(1 << 20)
+                    if not block:
+                        break
+                    buf += block
+                if buf.strip():
+                    yield buf
+
+        return wrapper, fragments()
+
+    def iter_rows_sharded(self, min_row=1, workers=None, shard_bytes=SHARD_BYTES):
+        """
+        与 iter_rows 产出相同，但行解码分给 workers 个子进程并行完成
+        主进程只负责解压与按 </row> 切片；同时在途的片段有上限，结果按提交顺序取回，保证行序不变
+        """
+        workers = workers or PARSE_WORKERS
+        wrapper, fragments = self._iter_fragments(shard_bytes)
+        expected = min_row
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_worker,
+                                 initargs=(self.decoder,)) as pool:
+            in_flight = deque()
+            fragments = iter(fragments)
+            exhausted = False
+            while in_flight or not exhausted:
+                while not exhausted and len(in_flight) < workers * 2:
+                    fragment = next(fragments, None)
+                    if fragment is None:
+                        exhausted = True
+                    else:
+                        in_flight.append(pool.submit(_decode_shard, wrapper, fragment))
+                if not in_flight:
+                    break
+                for row_idx, values in in_flight.popleft().result():
+                    row_idx = row_idx if row_idx is not None else expected
+                    if row_idx < min_row:
+                        expected = row_idx + 1
+                        continue
+                    while expected < row_idx:
+                        yield expected, ()
+                        expected += 1
+                    yield row_idx, values
+                    expected = row_idx + 1
+
+    def iter_batches(self, min_row=1, batch_size=10000, ncols=None, workers=1):
+        """
+        从 min_row 开始按批产出行列表，每行补齐/截断为 ncols 列
+        workers > 1 且页签足够大时分片并行解码
+        """
+        if workers > 1 and self.sheet_size() >= SHARD_MIN_BYTES:
+            rows = self.iter_rows_sharded(min_row, workers)
+        else:
+            rows = self.iter_rows(min_row)
+        batch = []
+        for _, values in rows:
+            if ncols is not None:
+                if len(values) < ncols:
+                    values = values + (None,) * (ncols - len(values))
+                elif len(values) > ncols:
+                    values = values[:ncols]
+            batch.append(values)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def estimate_sheet_rows(file_path, sheet_name):
+    """估算页签总行数（含表头），用于进度显示；.xls 或无法估算时返回 None"""
+    if not file_path.lower().endswith('.xlsx'):
+        return None
+    try:
+        with XlsxStreamReader(file_path, sheet_name) as reader:
+            return reader.dimension_rows()
+    except Exception:
+        return None
 
 
-
-def read_excel_fast(file_path, sheet_name, is_file1=True, skip_rows=0, chunk_size=10000):
+def read_excel_fast(file_path, sheet_name, is_file1=True, skip_rows=0, chunk_size=10000, iterator=False,
+                    workers=None):
     """
     快速读取Excel文件，支持大文件分块读取和多表头处理
     优化点：
-    1. 分离表头和数据读取，解决read_only模式下无法获取合并单元格的问题
+    1. xlsx 直接流式解析页签 XML，合并单元格从页签尾部读取，无需 openpyxl 全量加载
     2. 分块读取大型文件，显著降低内存占用
     3. 及时释放资源，减少内存泄漏
+    4. iterator=True 时返回 iter_excel_chunks 生成器，调用方可边读边处理，不再合并整表
+    workers: 分片解析的进程数，默认 PARSE_WORKERS
     """
-    try:
-        if file_path.lower().endswith('.xlsx'):
-            # # 阶段1：读取表头和合并单元格信息（使用非只读模式）
-            wb = load_workbook(file_path, data_only=True, read_only=False, keep_links=False)
-            ws = wb[sheet_name]
-
-            # 读取表头行（最多读取前2行）
-            max_header_rows = 2
-            header_rows = list(ws.iter_rows(values_only=True, max_row=max_header_rows))
-            merged_ranges = list(ws.merged_cells.ranges) if ws.merged_cells else []
-
-
-
-            # 处理表头
-            if is_file1 and len(header_rows) >= 2 and merged_ranges:
-                # 平台文件：处理一级+二级表头
-                level1 = [str(v or '') for v in header_rows[0]]
-                level2 = [str(v or '') for v in header_rows[1]]
+    chunks = iter_excel_chunks(file_path, sheet_name, is_file1=is_file1,
+                               skip_rows=skip_rows, chunk_size=chunk_size, workers=workers)
+    if iterator:
+        return chunks
 
-                # 处理一级表头的合并单元格
-                for merged in merged_ranges:
-                    # merged.bounds格式：(min_row, min_col, max_row, max_col)，索引从1开始
-                    if merged.bounds[1] == 1:  # 第1行
-                        min_col, max_col = merged.bounds[0], merged.bounds[2]
-                        fill_val = level1[min_col - 1]
-                        for c in range(min_col, max_col + 1):
-                            level1[c - 1] = fill_val
-
-                # 合并两级表头
-                cols = [f"{a}-{b}".strip('-') for a, b in zip(level1, level2)]
-                data_start_row = 3  # 数据从第3行开始（索引从1开始）
-
-            elif is_file1 and len(header_rows) >= 2 and not merged_ranges:
-                # ERP文件或单级表头处理
-                header_row_idx = skip_rows
-                if len(header_rows) > header_row_idx:
-                    cols = [str(v) if v is not None else '' for v in header_rows[header_row_idx]]
-                else:
-                    cols = []
-                data_start_row = header_row_idx + 2  # 数据开始行（索引从1开始）
-            elif not is_file1 and not merged_ranges:
-                # 非平台文件：处理一级表头
-                header_row_idx = skip_rows
-                if len(header_rows) > header_row_idx:
-                    cols = [str(v) if v is not None else '' for v in header_rows[header_row_idx]]
-                else:
-                    cols = []
-                data_start_row = header_row_idx + 2  # 数据开始行（索引从1开始）
-            elif not is_file1 and merged_ranges:
-
-                header_row = 1 if is_file1 else (skip_rows + 2)
-                cols = [str(v or '') for v in header_rows[header_row - 1]]
-                data_start_row = header_row + 1
-
-            # 清理列名
-            cols = [re.sub(r'[\*\s]+', '', c) for c in cols]
-            if not cols:
-                raise ValueError("未能正确解析表头，请检查文件格式")
+    # 合并所有数据块
+    df = pd.concat(list(chunks), ignore_index=True)
+    gc.collect()
+    return df
 
 
-
-            # 获取总数据行数（减去表头行）
-            total_rows = ws.max_row
-            if total_rows < data_start_row:
-                wb.close()
-                return pd.DataFrame(columns=cols)  # 空数据框
-
-            # 分块读取数据
-            chunks = []
-            current_row = data_start_row
-
-            while current_row <= total_rows:
-                # 计算当前块的结束行
-                end_row = min(current_row + chunk_size - 1, total_rows)
-
-                # 读取当前块数据
-                data_rows = list(ws.iter_rows(
-                    min_row=current_row,
-                    max_row=end_row,
-                    values_only=True
-                ))
-
-                # 创建数据块DataFrame
-                chunk_df = pd.DataFrame(data_rows, columns=cols)
-                chunks.append(chunk_df)
-
-                # 更新进度并释放内存
-                current_row = end_row + 1
-                del data_rows, chunk_df
-                gc.collect()
-
-            # 关闭数据工作簿
-            wb.close()
-            del wb, ws
-            gc.collect()
-
-            # 合并所有数据块
-            if chunks:
-                df = pd.concat(chunks, ignore_index=True)
-                del chunks
-                gc.collect()
-                return df
-            else:
-                return pd.DataFrame(columns=cols)
+def iter_excel_chunks(file_path, sheet_name, is_file1=True, skip_rows=0, chunk_size=10000, workers=None):
+    """
+    逐块产出 DataFrame（列名即解析后的表头），内存中同时只保留一块数据
+    至少产出一块：没有数据行时产出一个只有表头的空 DataFrame
+    解析结果按块写入 Arrow 缓存，同一文件（路径 + 修改时间）再次读取时直接内存映射缓存，不再解析
+    workers: 大页签分片解析的进程数，默认 PARSE_WORKERS；两侧同时解析时由调用方用 parse_workers 平分
+    """
+    cache_dir = sheet_cache_path(file_path, sheet_name, is_file1, skip_rows, chunk_size)
+    if cache_dir and os.path.isfile(os.path.join(cache_dir, _SHEET_CACHE_META)):
+        yield from _read_cached_chunks(cache_dir)
+        return
+    chunks = _parse_excel_chunks(file_path, sheet_name, is_file1, skip_rows, chunk_size, workers or PARSE_WORKERS)
+    if cache_dir is None:
+        yield from chunks
+    else:
+        yield from _write_through_cache(chunks, cache_dir)
+
+
+def _parse_excel_chunks(file_path, sheet_name, is_file1, skip_rows, chunk_size, workers):
+    """iter_excel_chunks 的实际解析"""
+    try:
+        if file_path.lower().endswith('.xlsx'):
+            # 阶段1：流式读取表头和合并单元格信息（只解析页签 XML，不加载整个工作簿）
+            with XlsxStreamReader(file_path, sheet_name) as reader:
+                # 读取表头行（最多读取前2行）
+                max_header_rows = 2
+                header_rows = reader.read_header(max_header_rows)
+                merged_ranges = reader.merged_ranges()
+
+                # 处理表头
+                if is_file1 and len(header_rows) >= 2 and merged_ranges:
+                    # 平台文件：处理一级+二级表头
+                    level1 = [str(v or '') for v in header_rows[0]]
+                    level2 = [str(v or '') for v in header_rows[1]]
+
+                    # 处理一级表头的合并单元格
+                    for merged in merged_ranges:
+                        # merged 格式：(min_col, min_row, max_col, max_row)，索引从1开始
+                        if merged[1] == 1:  # 第1行
+                            min_col, max_col = merged[0], merged[2]
+                            fill_val = level1[min_col - 1]
+                            for c in range(min_col, max_col + 1):
+                                level1[c - 1] = fill_val
+
+                    # 合并两级表头
+                    cols = [f"{a}-{b}".strip('-') for a, b in zip(level1, level2)]
+                    data_start_row = 3  # 数据从第3行开始（索引从1开始）
+
+                elif is_file1 and len(header_rows) >= 2 and not merged_ranges:
+                    # ERP文件或单级表头处理
+                    header_row_idx = skip_rows
+                    if len(header_rows) > header_row_idx:
+                        cols = [str(v) if v is not None else '' for v in header_rows[header_row_idx]]
+                    else:
+                        cols = []
+                    data_start_row = header_row_idx + 2  # 数据开始行（索引从1开始）
+                elif not is_file1 and not merged_ranges:
+                    # 非平台文件：处理一级表头
+                    header_row_idx = skip_rows
+                    if len(header_rows) > header_row_idx:
+                        cols = [str(v) if v is not None else '' for v in header_rows[header_row_idx]]
+                    else:
+                        cols = []
+                    data_start_row = header_row_idx + 2  # 数据开始行（索引从1开始）
+                elif not is_file1 and merged_ranges:
+
+                    header_row = 1 if is_file1 else (skip_rows + 2)
+                    cols = [str(v or '') for v in header_rows[header_row - 1]]
+                    data_start_row = header_row + 1
+
+                # 清理列名
+                cols = [re.sub(r'[\*\s]+', '', c) for c in cols]
+                if not cols:
+                    raise ValueError("未能正确解析表头，请检查文件格式")
+
+                # 阶段2：按批流式读取数据行，每批只保留 chunk_size 行
+                has_rows = False
+                for data_rows in reader.iter_batches(data_start_row, chunk_size, ncols=len(cols),
+                                                     workers=workers):
+                    has_rows = True
+                    yield pd.DataFrame(data_rows, columns=cols)
+                    del data_rows
+
+            if not has_rows:
+                yield pd.DataFrame(columns=cols)  # 空数据框
 
         elif file_path.lower().endswith('.xls'):
             max_header_rows = 2
@@ -229,43 +666,306 @@ def read_excel_fast(file_path, sheet_name, is_file1=True, skip_rows=0, chunk_siz
             cols = [re.sub(r'[\*\s]+', '', c) for c in cols]
 
             # 分块读取数据
-            chunks = []
             total_rows = sh.nrows
             current_row = data_start_row
+            if current_row >= total_rows:
+                yield pd.DataFrame(columns=cols)  # 空数据框
+
+            try:
+                while current_row < total_rows:
+                    end_row = min(current_row + chunk_size, total_rows)
+                    data = []
+                    for r in range(current_row, end_row):
+                        row_values = [sh.cell_value(r, c) for c in range(sh.ncols)]
+                        data.append(row_values)
+
+                    yield pd.DataFrame(data, columns=cols)
+
+                    current_row = end_row
+                    del data
+            finally:
+                # 释放资源
+                bk.release_resources()
+                del bk, sh
+                gc.collect()
+
+        else:
+            raise ValueError(f"不支持的文件格式: {file_path}")
 
-            while current_row < total_rows:
-                end_row = min(current_row + chunk_size, total_rows)
-                data = []
-                for r in range(current_row, end_row):
-                    row_values = [sh.cell_value(r, c) for c in range(sh.ncols)]
-                    data.append(row_values)
+    except Exception as e:
+        raise Exception(f"读取Excel文件失败: {str(e)}")
 
-                chunk_df = pd.DataFrame(data, columns=cols)
-                chunks.append(chunk_df)
+# =========================================================
+# 缓存目录
+# =========================================================
+def _user_cache_root():
+    """当前用户的缓存根目录：Windows 为 %LOCALAPPDATA%，其他系统为 $XDG_CACHE_HOME 或 ~/.cache"""
+    base = os.environ.get('LOCALAPPDATA') if os.name == 'nt' else os.environ.get('XDG_CACHE_HOME')
+    return os.path.join(base or os.path.join(os.path.expanduser('~'), '.cache'), 'excel_compare')
 
-                current_row = end_row
-                del data, chunk_df
-                gc.collect()
 
-            # 释放资源
-            bk.release_resources()
-            del bk, sh
-            gc.collect()
+# 缓存内容会被直接加载，不能放在所有用户可写的系统临时目录中
+CACHE_ROOT = _user_cache_root()
 
-            # 合并数据块
-            if chunks:
-                df = pd.concat(chunks, ignore_index=True)
-                del chunks
-                gc.collect()
-                return df
-            else:
-                return pd.DataFrame(columns=cols)
 
+def ensure_cache_dir(path):
+    """创建缓存目录，根目录权限为 0700（仅当前用户可访问）"""
+    os.makedirs(CACHE_ROOT, mode=0o700, exist_ok=True)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+
+
+# =========================================================
+# 解析结果缓存（Arrow IPC，内存映射读取）
+# =========================================================
+SHEET_CACHE_ENABLED = True
+SHEET_CACHE_DIR = os.path.join(CACHE_ROOT, 'sheets')
+# 最多保留的页签缓存份数，超出时删除最久未用的
+SHEET_CACHE_KEEP = 16
+# 解析逻辑或缓存格式变化时递增，旧缓存自动失效
+_SHEET_CACHE_VERSION = 1
+_SHEET_CACHE_META = 'meta.json'
+
+# object 列中混合类型的值按 (类别, 文本) 存储，读回时还原成原来的 Python 类型
+_VALUE_KINDS = {str: 1, int: 2, float: 3, bool: 4, datetime: 5, time: 6}
+_KIND_DECODERS = {1: str, 2: int, 3: float, 4: lambda t: t == 'True',
+                  5: datetime.fromisoformat, 6: time.fromisoformat}
+
+
+class _Uncacheable(Exception):
+    """块中有无法无损存入缓存的值"""
+
+
+def sheet_cache_path(file_path, sheet_name, is_file1=True, skip_rows=0, chunk_size=10000):
+    """
+    页签解析结果的缓存目录：按 路径 + 修改时间 + 大小 + 页签 + 表头参数 + 块大小 定位
+    块大小也参与定位：各块的列类型由 pandas 按块推断，缓存须与直接解析逐块一致
+    未启用或未安装 pyarrow 时返回 None
+    """
+    if pa is None or not SHEET_CACHE_ENABLED:
+        return None
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    parts = (_SHEET_CACHE_VERSION, os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size,
+             sheet_name, bool(is_file1), skip_rows, chunk_size)
+    key = hashlib.sha256('\x1f'.join(map(str, parts)).encode('utf-8')).hexdigest()[:32]
+    return os.path.join(SHEET_CACHE_DIR, key)
+
+
+def cached_sheet_rows(file_path, sheet_name, is_file1=True, skip_rows=0, chunk_size=10000):
+    """已缓存页签的数据行数，未缓存时返回 None"""
+    cache_dir = sheet_cache_path(file_path, sheet_name, is_file1, skip_rows, chunk_size)
+    try:
+        with open(os.path.join(cache_dir, _SHEET_CACHE_META), encoding='utf-8') as fh:
+            return json.load(fh)['rows']
+    except (TypeError, OSError, ValueError, KeyError):
+        return None
+
+
+def _chunk_to_arrow(df):
+    """
+    DataFrame 块 -> Arrow 表，列按位置命名（表头可能重名），原列名存在元数据中
+    数值/日期/布尔列按原生类型存储；object 列全为字符串时存字符串，否则另存一列值类别
+    """
+    arrays, names = [], []
+    for i in range(df.shape[1]):
+        series = df.iloc[:, i]
+        if series.dtype != object:
+            arrays.append(pa.Array.from_pandas(series))
+            names.append(f"c{i}")
+            continue
+        values = series.tolist()
+        kinds = [0 if v is None else _VALUE_KINDS.get(type(v)) for v in values]
+        if None in kinds:
+            raise _Uncacheable()
+        if all(k in (0, 1) for k in kinds):
+            arrays.append(pa.array(values, type=pa.string()))
+            names.append(f"c{i}")
+            continue
+        texts = [None if v is None else repr(v) if k == 3 else v.isoformat() if k in (5, 6) else str(v)
+                 for v, k in zip(values, kinds)]
+        arrays.extend([pa.array(texts, type=pa.string()), pa.array(kinds, type=pa.int8())])
+        names.extend([f"c{i}", f"k{i}"])
+    columns = json.dumps([str(c) for c in df.columns], ensure_ascii=False)
+    return pa.Table.from_arrays(arrays, names=names, metadata={'columns': columns})
+
+
+def _arrow_to_chunk(table):
+    """_chunk_to_arrow 的逆过程"""
+    columns = json.loads(table.schema.metadata[b'columns'])
+    fields = set(table.column_names)
+    data = {}
+    for i in range(len(columns)):
+        col = table.column(f"c{i}")
+        if f"k{i}" in fields:
+            kinds = table.column(f"k{i}").to_pylist()
+            data[i] = pd.Series([None if k == 0 else _KIND_DECODERS[k](t)
+                                 for k, t in zip(kinds, col.to_pylist())], dtype=object)
         else:
-            raise ValueError(f"不支持的文件格式: {file_path}")
+            data[i] = col.to_pandas()
+    df = pd.DataFrame(data, index=pd.RangeIndex(table.num_rows))
+    df.columns = columns
+    return df
+
+
+def _read_cached_chunks(cache_dir):
+    with open(os.path.join(cache_dir, _SHEET_CACHE_META), encoding='utf-8') as fh:
+        meta = json.load(fh)
+    os.utime(cache_dir)  # 记录最近使用，清理时保留
+    for i in range(meta['chunks']):
+        with pa.memory_map(os.path.join(cache_dir, f"{i:06d}.arrow")) as source:
+            table = pa.ipc.open_file(source).read_all()
+        yield _arrow_to_chunk(table)
+
+
+def _write_through_cache(chunks, cache_dir):
+    """边产出边把块写入临时目录，全部写完再原子改名为缓存目录；中途放弃或出错不留缓存"""
+    tmp_dir = f"{cache_dir}.{os.getpid()}.tmp"
+    caching, count, rows = True, 0, 0
+    try:
+        ensure_cache_dir(tmp_dir)
+    except OSError:
+        caching = False
+    try:
+        for chunk in chunks:
+            if caching:
+                try:
+                    table = _chunk_to_arrow(chunk)
+                    with pa.ipc.new_file(os.path.join(tmp_dir, f"{count:06d}.arrow"), table.schema) as writer:
+                        writer.write_table(table)
+                except (_Uncacheable, pa.ArrowException, OSError):
+                    caching = False
+            count += 1
+            rows += len(chunk)
+            yield chunk
+        if caching:
+            with open(os.path.join(tmp_dir, _SHEET_CACHE_META), 'w', encoding='utf-8') as fh:
+                json.dump({'chunks': count, 'rows': rows}, fh)
+            try:
+                os.replace(tmp_dir, cache_dir)
+            except OSError:
+                pass  # 其他进程已写好同一份缓存
+            _prune_sheet_cache()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _prune_sheet_cache():
+    try:
+        entries = [os.path.join(SHEET_CACHE_DIR, name) for name in os.listdir(SHEET_CACHE_DIR)
+                   if not name.endswith('.tmp')]
+    except OSError:
+        return
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for path in entries[SHEET_CACHE_KEEP:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def sanitize_column_name(col_name):
+    """把任意列名变成合法 MySQL 列名（内存比对也用同一套列名）"""
+    clean = re.sub(r'[^\w]', '_', str(col_name))
+    if clean and clean[0].isdigit():
+        clean = 'col_' + clean
+    return clean[:64] or 'unnamed_column'
+
+
+def to_text(series):
+    """整列转字符串，日期列保持与 str(Timestamp) 一致的格式"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime('%Y-%m-%d %H:%M:%S')
+    return series.astype(str)
+
+
+_MAX_EXACT_INT = 2 ** 53
+
+
+def _is_whole_float(value):
+    return isinstance(value, float) and value.is_integer() and abs(value) < _MAX_EXACT_INT
+
+
+def cell_text(series):
+    """
+    整列转文本（导出、差异说明共用），与原先 read_excel(dtype=str) 写出的一致：空值为 ''，
+    整数值的浮点数不带 .0（含空值的整数列解析后是 float64，混合列中也可能有 float）
+    """
+    text = to_text(series)
+    if pd.api.types.is_float_dtype(series):
+        whole = series.notna() & (series % 1 == 0) & (series.abs() < _MAX_EXACT_INT)
+    elif series.dtype == object:
+        whole = series.map(_is_whole_float).astype(bool)
+    else:
+        whole = None
+    if whole is not None and whole.any():
+        text = text.where(~whole, series[whole].astype('int64').astype(str))
+    return text.where(series.notna(), "")
+
+
+def to_number(series):
+    """整列转数值，去掉千分位逗号，无法识别的记为 NaN"""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype(float)
+    text = series.astype(str).str.replace(',', '', regex=False).str.strip()
+    return pd.to_numeric(text.where(series.notna()), errors='coerce').astype(float)
+
+
+def _to_date_text(series):
+    """整列转 'YYYY-MM-DD'，支持日期对象、'2019-12-19'、'2019/1/5'、'20191219' 等写法，无法识别的记为 NaN"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime('%Y-%m-%d')
+    parts = to_text(series).where(series.notna()).str.strip().str.extract(r'^(\d{4})\D?(\d{1,2})\D?(\d{1,2})')
+    dates = pd.to_datetime(parts[0] + '-' + parts[1].str.zfill(2) + '-' + parts[2].str.zfill(2),
+                           format='%Y-%m-%d', errors='coerce')
+    return dates.dt.strftime('%Y-%m-%d')
+
+
+def _has_value(series):
+    """非空且不是空白字符串的单元格"""
+    return series.notna() & (series.astype(str).str.strip() != '')
+
+
+def prepare_columns(df, types, abs_depreciation=False, coerced=None):
+    """
+    按列向量化准备入库/比对用的数据，返回与 df.columns 对应的列列表（空值为 None）：
+    1. 数值列整列转数值，日期列整列转 'YYYY-MM-DD'，无法识别的值记为空
+    2. abs_depreciation（表二）时字段名包含"折旧"的列整列取绝对值，无法转成数值的保持原值
+    3. 其余列整列转字符串
+    coerced: 传入字典时按列累加无法识别、被记为空的单元格数量（{列名: 个数}），供调用方提示
+    """
+    prepared = []
+    for i, col_name in enumerate(df.columns):
+        series = df.iloc[:, i]
+        data_type = types.get(col_name)
+        if data_type == "数值":
+            numeric = to_number(series)
+            if abs_depreciation and "折旧" in col_name:
+                numeric = numeric.abs()
+            text = numeric.round(6).astype(str)
+            not_null = numeric.notna()
+        elif data_type == "日期":
+            text = _to_date_text(series)
+            not_null = text.notna()
+        elif abs_depreciation and "折旧" in col_name:
+            numeric = pd.to_numeric(series, errors='coerce').astype(float)
+            text = numeric.abs().astype(str).where(numeric.notna(), to_text(series))
+            not_null = series.notna()
+        else:
+            text = to_text(series)
+            not_null = series.notna()
+        if coerced is not None and data_type in ("数值", "日期"):
+            lost = int((_has_value(series) & ~not_null).sum())
+            if lost:
+                coerced[col_name] = coerced.get(col_name, 0) + lost
+        prepared.append(text.astype(object).where(not_null, None))
+
+    return prepared
+
+
+def row_hash_series(df):
+    """整行内容的 64 位哈希（16 位十六进制文本），用于找出两次导入之间变化的行"""
+    hashes = pd.util.hash_pandas_object(df, index=False)
+    return pd.Series([f"{h:016x}" for h in hashes.to_numpy()], index=df.index, dtype=object)
 
-    except Exception as e:
-        raise Exception(f"读取Excel文件失败: {str(e)}")
 
 def read_mapping_table(file_path):
     """读取资产分类映射表，返回 DataFrame"""
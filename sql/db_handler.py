@@ -1,25 +1,196 @@
 # db_handler.py
+import os
+import time
+import logging
+import hashlib
+import sqlite3
+import tempfile
+from contextlib import contextmanager
 import mysql.connector
+from mysql.connector import pooling
 import pandas as pd
-import re
-from data_handler import read_excel_fast
+from data_handler import read_excel_fast, sanitize_column_name, prepare_columns, CACHE_ROOT, ensure_cache_dir
 
 # ------------------ 数据库配置 ------------------
+# 存储引擎：'mysql' 连接 DB_CONFIG 指定的服务器；'sqlite' 使用内嵌数据库，无需启动任何服务
+# 默认值可由环境变量 EXCEL_COMPARE_DB_ENGINE 指定，界面上选择比对引擎时用 set_db_engine 切换
+DB_ENGINE = os.environ.get('EXCEL_COMPARE_DB_ENGINE', 'mysql')
+# sqlite 数据库文件，':memory:' 表示进程内共享的内存库
+SQLITE_DATABASE = ':memory:'
+# 界面选择 SQLite 引擎时使用的库文件（放在当前用户的缓存目录下，两侧可由子进程并行导入）
+SQLITE_FILE_DATABASE = os.path.join(CACHE_ROOT, 'compare.sqlite3')
+_sqlite_keeper = None  # 内存库在最后一个连接关闭时即被销毁，保留一个连接让数据跨连接存活
+
 DB_CONFIG = {
     'host': 'localhost',
     'user': 'root',
     'password': 'qwer.1234',
     'database': 'excel_compare',
-    'charset': 'utf8mb4'
+    'charset': 'utf8mb4',
+    'allow_local_infile': True
 }
 
+# 连接池大小：一次比对内的导入、ALTER/UPDATE、查询都从池中借用连接
+DB_POOL_SIZE = 5
+_pool = None
+
+# 推断文本列长度的上限，超过则用 LONGTEXT（避免超出 InnoDB 65535 字节行长限制）
+_MAX_VARCHAR_LEN = 255
+
+# 批量导入方式：优先 LOAD DATA LOCAL INFILE；服务器禁用 local_infile 时自动改为多行 INSERT
+USE_LOCAL_INFILE = True
+# LOAD DATA LOCAL INFILE 被拒绝时的错误码
+_LOCAL_INFILE_ERRNOS = {1148, 2068, 3948, 3950}
+# 多行 INSERT 每条语句的最大占位符数量，避免超过 max_allowed_packet
+_MAX_INSERT_PLACEHOLDERS = 20000
+
+# ------------------ 导入仓库 ------------------
+# 已导入的表按内容指纹保留在库中（表名 store_<指纹前16位>），文件与导入规则都未变化时直接复用
+IMPORT_STORE_TABLE = 'import_store'
+# 每个来源（文件+工作表+表一/表二）保留的导入份数：本次 + 上一次，用于按行哈希找出变化的主键
+IMPORT_STORE_KEEP = 2
+# 每次比对的差异主键，下次只有一侧变化时据此增量重比
+COMPARE_RUNS_TABLE = 'compare_runs'
+COMPARE_DIFF_KEYS_TABLE = 'compare_diff_keys'
+# 整行内容哈希列，导入时随数据写入
+ROW_HASH_COLUMN = '_row_hash'
+# 导入逻辑或表结构变化时递增，旧的导入自动失效
+_IMPORT_STORE_VERSION = 1
+
+
+# =========================================================
+# 连接池
+# =========================================================
+def _is_sqlite():
+    return DB_ENGINE == 'sqlite'
+
+
+def numeric_sql_type():
+    """
+    规则中"数值"类型列的类型（计算字段同样使用），随当前引擎取值
+    sqlite 的 DECIMAL 是 NUMERIC 亲和性，整数值会存成 INTEGER 并在除法时整除，所以用 REAL
+    """
+    return 'REAL' if _is_sqlite() else 'DECIMAL(24,6)'
+
+
+def set_db_engine(engine, sqlite_database=None):
+    """切换存储引擎：'mysql' 或 'sqlite'（sqlite_database 默认为 SQLITE_FILE_DATABASE），连接池随之重建"""
+    global DB_ENGINE, SQLITE_DATABASE, _pool, _sqlite_keeper
+    if engine not in ('mysql', 'sqlite'):
+        raise ValueError(f"未知的存储引擎: {engine}")
+    if engine == 'sqlite':
+        sqlite_database = sqlite_database or SQLITE_FILE_DATABASE
+        if sqlite_database != ':memory:':
+            ensure_cache_dir(os.path.dirname(sqlite_database))
+        SQLITE_DATABASE = sqlite_database
+    if _sqlite_keeper is not None and (engine != 'sqlite' or SQLITE_DATABASE != ':memory:'):
+        _sqlite_keeper.close()
+        _sqlite_keeper = None
+    DB_ENGINE = engine
+    _pool = None
+
+
+def _sqlite_concat(*values):
+    """与 MySQL CONCAT 一致：任一参数为 NULL 则结果为 NULL"""
+    if any(v is None for v in values):
+        return None
+    return ''.join(str(v) for v in values)
+
+
+def _sqlite_connect():
+    """打开 sqlite 连接，并注册比对 SQL 里用到的 MySQL 函数（CONCAT 的 NULL 语义）"""
+    if SQLITE_DATABASE == ':memory:':
+        conn = sqlite3.connect('file:excel_compare?mode=memory&cache=shared', uri=True)
+    else:
+        # 两侧并行导入时两个进程轮流写同一个库文件，等待写锁的时间放宽
+        conn = sqlite3.connect(SQLITE_DATABASE, timeout=60)
+        conn.execute("PRAGMA journal_mode = MEMORY")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.create_function('CONCAT', -1, _sqlite_concat, deterministic=True)
+    return conn
+
+
+def _sql(query):
+    """占位符按引擎转换：MySQL 用 %s，sqlite 用 ?"""
+    return query.replace('%s', '?') if _is_sqlite() else query
+
+
+def _stream_cursor(conn):
+    """逐批取数的游标：MySQL 需非缓冲游标，sqlite 游标本身就是逐行步进的"""
+    return conn.cursor() if _is_sqlite() else conn.cursor(buffered=False)
+
+
+def _discard_unread(conn):
+    """提前结束读取时丢弃 MySQL 未读完的结果，连接才能归还连接池"""
+    if getattr(conn, 'unread_result', False):
+        conn.consume_results()
+
+
+def _get_pool():
+    """懒加载连接池（库必须已存在，所以在 init_database 之后首次使用时才创建）"""
+    global _pool
+    if _pool is None:
+        _pool = pooling.MySQLConnectionPool(
+            pool_name='excel_compare',
+            pool_size=DB_POOL_SIZE,
+            pool_reset_session=True,
+            **DB_CONFIG
+        )
+    return _pool
+
+
+def engine_settings():
+    """当前的存储引擎配置，传给子进程后用 apply_engine_settings 还原（spawn 启动的子进程不继承运行时修改）"""
+    return {'DB_ENGINE': DB_ENGINE, 'SQLITE_DATABASE': SQLITE_DATABASE, 'DB_CONFIG': dict(DB_CONFIG),
+            'USE_LOCAL_INFILE': USE_LOCAL_INFILE}
+
+
+def apply_engine_settings(settings):
+    global DB_ENGINE, SQLITE_DATABASE, DB_CONFIG, USE_LOCAL_INFILE, _pool
+    DB_ENGINE = settings['DB_ENGINE']
+    SQLITE_DATABASE = settings['SQLITE_DATABASE']
+    DB_CONFIG = settings['DB_CONFIG']
+    USE_LOCAL_INFILE = settings['USE_LOCAL_INFILE']
+    _pool = None
+
+
+def supports_multiprocess():
+    """sqlite 内存库只存在于当前进程，不能由子进程写入"""
+    return not (_is_sqlite() and SQLITE_DATABASE == ':memory:')
+
+
+@contextmanager
+def get_connection(autocommit=False):
+    """从连接池借出一个连接，with 块结束时归还（sqlite 直接新开连接，开销可忽略）"""
+    if _is_sqlite():
+        conn = _sqlite_connect()
+        if autocommit:
+            conn.isolation_level = None
+    else:
+        conn = _get_pool().get_connection()
+        conn.autocommit = autocommit
+    try:
+        yield conn
+    finally:
+        conn.close()  # 池化连接的 close() 只是归还
+
 
 # =========================================================
 # 基础初始化
 # =========================================================
 def init_database():
     """创建库、删旧表"""
+    global _sqlite_keeper
     try:
+        if _is_sqlite():
+            if SQLITE_DATABASE == ':memory:' and _sqlite_keeper is None:
+                _sqlite_keeper = _sqlite_connect()
+            with get_connection(autocommit=True) as conn:
+                for table in ("temp_table1", "temp_table2"):
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+            init_import_store()
+            return True
+
         conn = mysql.connector.connect(
             host=DB_CONFIG['host'],
             user=DB_CONFIG['user'],
@@ -30,121 +201,152 @@ def init_database():
         cursor.execute(f"USE {DB_CONFIG['database']}")
         cursor.execute("DROP TABLE IF EXISTS temp_table1")
         cursor.execute("DROP TABLE IF EXISTS temp_table2")
-        cursor.execute("DROP TABLE IF EXISTS temp_mapping_table")
         conn.close()
+        init_import_store()
         return True
     except Exception as e:
         print(f"数据库初始化失败: {str(e)}")
         return False
 
 
-def sanitize_column_name(col_name):
-    """把任意列名变成合法 MySQL 列名"""
-    clean = re.sub(r'[^\w]', '_', str(col_name))
-    if clean and clean[0].isdigit():
-        clean = 'col_' + clean
-    return clean[:64] or 'unnamed_column'
-
-
 # =========================================================
 # 表与数据导入
 # =========================================================
-def import_excel_to_db(file_path, sheet_name, table_name, is_file1=True, skip_rows=0, chunk_size=5000):
-    """把 Excel 分块写入 MySQL"""
+def import_excel_to_db(file_path, sheet_name, table_name, is_file1=True, skip_rows=0, chunk_size=5000,
+                       column_types=None, computed_columns=None, index_columns=None, progress_callback=None,
+                       workers=None):
+    """
+    把 Excel 分块写入数据库：边解析边插入，内存中只保留当前块
+    column_types: {列名: 规则数据类型(数值/日期/文本)}，对应列按原生类型建表，其余列为 LONGTEXT
+    computed_columns: {列名: (SQL 类型, func)}，func 接收本块已转换好的数据（DataFrame）返回该列的 Series，
+                      随数据一起写入，避免导入后再 ALTER + 全表 UPDATE
+    index_columns: 建表时一并创建普通索引的列
+    progress_callback: 每块写入后以累计行数回调
+    workers: 分片解析的进程数（见 read_excel_fast）
+    返回 (导入行数, {列名: 无法识别为数值/日期而记为空的单元格数})
+    """
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        cursor.execute(f"USE {DB_CONFIG['database']}")
-
-        df = read_excel_fast(file_path, sheet_name, is_file1=is_file1,
-                             skip_rows=skip_rows, chunk_size=chunk_size)
-
-        if df.empty:
-            conn.close()
-            return 0
-
-        df.columns = [sanitize_column_name(c) for c in df.columns]
-
-        # 建表
-        create_sql = _generate_create_table_sql(df, table_name)
-        cursor.execute(create_sql)
-
-        # 分块插入
-        total_rows = len(df)
-        for start in range(0, total_rows, chunk_size):
-            chunk = df.iloc[start:start + chunk_size]
-            _insert_data(cursor, table_name, chunk)
-            conn.commit()
-
-        conn.close()
-        return total_rows
+        chunks = read_excel_fast(file_path, sheet_name, is_file1=is_file1,
+                                 skip_rows=skip_rows, chunk_size=chunk_size, iterator=True, workers=workers)
+        types = {sanitize_column_name(c): t for c, t in (column_types or {}).items()}
+
+        computed_columns = computed_columns or {}
+
+        total_rows = 0
+        coerced = {}
+        columns = None
+        schema = None
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            for chunk in chunks:
+                if chunk.empty:
+                    continue
+                if columns is None:
+                    columns = [sanitize_column_name(c) for c in chunk.columns]
+                chunk.columns = columns
+
+                prepared = prepare_columns(chunk, types, abs_depreciation=not is_file1, coerced=coerced)
+                computed = _compute_columns(columns, prepared, computed_columns)
+                if schema is None:
+                    # 建表（首块到达时即可确定表头，文本列长度按首块推断）
+                    schema = _infer_schema(columns, types, prepared)
+                    schema.update({name: sql_type for name, (sql_type, _) in computed_columns.items()})
+                    _create_table(cursor, columns + list(computed_columns), table_name, schema, index_columns)
+                else:
+                    _widen_text_columns(cursor, table_name, schema, columns, prepared)
+
+                _bulk_load(cursor, table_name, columns + list(computed_columns),
+                           list(zip(*[col.tolist() for col in prepared + computed])))
+                conn.commit()
+                total_rows += len(chunk)
+                if progress_callback:
+                    progress_callback(total_rows)
+
+        return total_rows, coerced
     except Exception as e:
         raise Exception(f"导入Excel到数据库失败: {str(e)}")
 
-def prepare_asset_category_mapping(rules, rule_file):
-    """
-          预先准备资产分类映射表数据
-          """
-    # 检查是否有资产分类字段需要对比
-    has_asset_category = any(field_name == "资产分类" for field_name in rules.keys())
-    if not has_asset_category:
-        return False
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        cursor.execute(f"USE {DB_CONFIG['database']}")
-        conn.autocommit = True
-        # 加载资产分类映射表
-        mapping_df = _load_asset_category_mapping(rule_file)
-        if mapping_df.empty or '同源目录完整名称' not in mapping_df.columns or '同源目录编码' not in mapping_df.columns:
-            return False
-        # 创建临时映射表
-        create_mapping_table_sql = """
-              CREATE TABLE temp_mapping_table (
-                  `同源目录完整名称` VARCHAR(255),
-                  `同源目录编码` VARCHAR(50)
-              )
-              """
-        cursor.execute(create_mapping_table_sql)
-        # 批量插入映射数据
-        if not mapping_df.empty:
-            # 准备批量插入数据
-            insert_data = []
-            for _, row in mapping_df.iterrows():
-                try:
-                    insert_data.append((str(row['同源目录完整名称']), str(row['同源目录编码'])))
-                except:
-                    continue
+def _sql_type_for(data_type):
+    """规则数据类型 -> MySQL 列类型（文本列的长度另行推断）"""
+    if data_type == "数值":
+        return numeric_sql_type()
+    if data_type == "日期":
+        return "DATE"
+    return "LONGTEXT"
+
+
+def _text_sql_type(max_len):
+    """按实际最大长度推断文本列类型：取不小于长度的 2 的幂，超过上限用 LONGTEXT"""
+    if max_len > _MAX_VARCHAR_LEN:
+        return "LONGTEXT"
+    width = 16
+    while width < max_len:
+        width *= 2
+    return f"VARCHAR({min(width, _MAX_VARCHAR_LEN)})"
+
+
+def _max_text_len(series):
+    lengths = series.dropna().str.len()
+    return int(lengths.max()) if not lengths.empty else 0
+
+
+def _infer_schema(columns, types, prepared):
+    """根据规则类型与首块数据确定每列的 SQL 类型"""
+    schema = {}
+    for col_name, values in zip(columns, prepared):
+        data_type = types.get(col_name)
+        if data_type == "文本":
+            schema[col_name] = _text_sql_type(_max_text_len(values))
+        else:
+            schema[col_name] = _sql_type_for(data_type)
+    return schema
 
-            if insert_data:
-                insert_sql = """
-                      INSERT INTO temp_mapping_table (`同源目录完整名称`, `同源目录编码`)
-                      VALUES (%s, %s)
-                      """
-                # 分批插入，避免数据量过大
-                batch_size = 1000
-                for i in range(0, len(insert_data), batch_size):
-                    batch = insert_data[i:i + batch_size]
-                    cursor.executemany(insert_sql, batch)
-                    conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        raise Exception(f"准备资产分类映射表时出错: {str(e)}")
 
-def _load_asset_category_mapping(rule_file):
-    """
-    从规则文件中加载资产分类映射表
-    """
-    try:
-        # 读取规则文件中的"资产分类映射表"页签，跳过第一行
-        mapping_df = pd.read_excel(rule_file, sheet_name='资产分类映射表', skiprows=1)
-        return mapping_df
-    except Exception as e:
-        raise Exception(f"读取资产分类映射表失败: {str(e)}")
+def _widen_text_columns(cursor, table_name, schema, columns, prepared):
+    """后续块的文本比首块推断的长度更长时，扩宽对应列（sqlite 不限制 VARCHAR 长度，无需处理）"""
+    if _is_sqlite():
+        return
+    for col_name, values in zip(columns, prepared):
+        current = schema[col_name]
+        if not current.startswith("VARCHAR"):
+            continue
+        needed = _text_sql_type(_max_text_len(values))
+        if needed == current:
+            continue
+        if needed.startswith("VARCHAR") and int(needed[8:-1]) < int(current[8:-1]):
+            continue
+        cursor.execute(f"ALTER TABLE `{table_name}` MODIFY COLUMN `{col_name}` {needed}")
+        schema[col_name] = needed
+
+
+def _compute_columns(columns, prepared, computed_columns):
+    """按本块已转换好的数据计算附加列"""
+    if not computed_columns:
+        return []
+    frame = pd.DataFrame(dict(zip(columns, prepared)))
+    result = []
+    for name, (_, func) in computed_columns.items():
+        values = func(frame)
+        result.append(values.astype(object).where(values.notna(), None))
+    return result
+
+
+def _create_table(cursor, columns, table_name, schema=None, index_columns=None):
+    """建表；sqlite 不支持表内 INDEX 和 ENGINE 子句，索引单独创建"""
+    if not _is_sqlite():
+        cursor.execute(_generate_create_table_sql(columns, table_name, schema, index_columns))
+        return
+    schema = schema or {}
+    cols = [f"`{col}` {schema.get(col, 'LONGTEXT')}" for col in columns]
+    cursor.execute(f"CREATE TABLE `{table_name}` (`id` INTEGER PRIMARY KEY, {', '.join(cols)})")
+    for col in index_columns or []:
+        cursor.execute(f"CREATE INDEX `idx_{table_name}{col}` ON `{table_name}` (`{col}`)")
 
-def _generate_create_table_sql(df, table_name):
-    cols = [f"`{col}` LONGTEXT" for col in df.columns]
+
+def _generate_create_table_sql(columns, table_name, schema=None, index_columns=None):
+    schema = schema or {}
+    cols = [f"`{col}` {schema.get(col, 'LONGTEXT')}" for col in columns]
+    cols += [f"INDEX `idx_{table_name}{col}` (`{col}`)" for col in (index_columns or [])]
     sql = f"""
     CREATE TABLE `{table_name}` (
         `id` INT AUTO_INCREMENT PRIMARY KEY,
@@ -154,110 +356,374 @@ def _generate_create_table_sql(df, table_name):
     return sql
 
 
-def _insert_data(cursor, table_name, df):
-    if df.empty:
+def _bulk_load(cursor, table_name, columns, rows):
+    """
+    批量写入一块数据
+    优先写临时 TSV 后 LOAD DATA LOCAL INFILE；被服务器/客户端拒绝时改用多行 INSERT
+    sqlite 没有网络往返，直接 executemany 逐行插入即可
+    """
+    global USE_LOCAL_INFILE
+    if _is_sqlite():
+        placeholders = ",".join(["?"] * len(columns))
+        cols = ",".join(f"`{c}`" for c in columns)
+        cursor.executemany(f"INSERT INTO `{table_name}` ({cols}) VALUES ({placeholders})", rows)
         return
-    cols = [f"`{c}`" for c in df.columns]
-    placeholders = ",".join(["%s"] * len(df.columns))
-    sql = f"INSERT INTO `{table_name}` ({','.join(cols)}) VALUES ({placeholders})"
-
-    # 判断是否为表二
-    is_table2 = table_name == 'temp_table2'
-
-    processed_data = []
-    for _, row in df.iterrows():
-        processed_row = []
-        for i, col_name in enumerate(df.columns):
-            value = row[col_name]
-            # 如果是表二且字段名包含"折旧"，则取绝对值
-            if is_table2 and "折旧" in col_name:
-                try:
-                    # 尝试将值转换为数值并取绝对值
-                    if pd.notna(value):
-                        numeric_value = float(value)
-                        processed_row.append(str(abs(numeric_value)))
-                    else:
-                        processed_row.append(None)
-                except (ValueError, TypeError):
-                    # 如果转换失败，保持原始值
-                    processed_row.append(str(value) if pd.notna(value) else None)
-            else:
-                processed_row.append(str(value) if pd.notna(value) else None)
-        processed_data.append(tuple(processed_row))
-
-    cursor.executemany(sql, processed_data)
+    if USE_LOCAL_INFILE:
+        try:
+            _load_data_local_infile(cursor, table_name, columns, rows)
+            return
+        except mysql.connector.Error as e:
+            if e.errno not in _LOCAL_INFILE_ERRNOS:
+                raise
+            USE_LOCAL_INFILE = False
+            logging.warning(f"LOAD DATA LOCAL INFILE 不可用，改用多行 INSERT: {str(e)}")
+    _insert_multi_values(cursor, table_name, columns, rows)
+
+
+def _tsv_escape(value):
+    """按 LOAD DATA 默认转义规则写单个字段，None 写成 \\N"""
+    if value is None:
+        return '\\N'
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r').replace('\0', '\\0'))
+
+
+def _load_data_local_infile(cursor, table_name, columns, rows):
+    cols = ",".join(f"`{c}`" for c in columns)
+    # Windows 下文件打开期间不能被再次读取，所以先写完关闭，再交给 MySQL
+    fd, path = tempfile.mkstemp(suffix='.tsv', prefix=f'{table_name}_')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as fh:
+            for row in rows:
+                fh.write('\t'.join(_tsv_escape(v) for v in row))
+                fh.write('\n')
+        sql = (f"LOAD DATA LOCAL INFILE %s INTO TABLE `{table_name}` CHARACTER SET utf8mb4 "
+               f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({cols})")
+        cursor.execute(sql, (path.replace('\\', '/'),))
+    finally:
+        os.remove(path)
+
+
+def _insert_multi_values(cursor, table_name, columns, rows):
+    """INSERT ... VALUES (...),(...) 按占位符上限分批"""
+    cols = ",".join(f"`{c}`" for c in columns)
+    row_placeholder = "(" + ",".join(["%s"] * len(columns)) + ")"
+    batch_rows = max(1, _MAX_INSERT_PLACEHOLDERS // max(1, len(columns)))
+    for start in range(0, len(rows), batch_rows):
+        batch = rows[start:start + batch_rows]
+        sql = f"INSERT INTO `{table_name}` ({cols}) VALUES " + ",".join([row_placeholder] * len(batch))
+        cursor.execute(sql, [v for row in batch for v in row])
 
 
 # =========================================================
 # 通用查询
 # =========================================================
 # 修改 db_handler.py 中的 execute_query 方法
-def execute_query(query, params=None, executemany=False):
-    """执行 SQL 并返回 DataFrame"""
+def execute_query(query, params=None, executemany=False, wanted_keys=None):
+    """
+    执行 SQL 并返回 DataFrame
+    wanted_keys 不为 None 时先在同一连接上建好临时键表 _wanted_keys（列 _pk_concat），查询可 JOIN 它限定主键
+    """
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        conn.autocommit = True
-        cursor = conn.cursor()
-        if params:
-            if executemany:
-                cursor.executemany(query, params)
+        with get_connection(autocommit=True) as conn:
+            cursor = conn.cursor()
+            if wanted_keys is not None:
+                _create_wanted_keys(cursor, '_pk_concat', wanted_keys)
+            if params:
+                if executemany:
+                    cursor.executemany(_sql(query), params)
+                else:
+                    cursor.execute(_sql(query), params)
             else:
-                cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        columns = [desc[0] for desc in cursor.description] if cursor.description else []
-        rows = cursor.fetchall()
-        df = pd.DataFrame(rows, columns=columns)
-        conn.close()
-        return df
+                cursor.execute(query)
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            rows = cursor.fetchall()
+            if wanted_keys is not None:
+                cursor.execute(_drop_wanted_keys_sql())
+        return pd.DataFrame(rows, columns=columns)
     except Exception as e:
         raise Exception(f"执行查询失败: {str(e)}")
 
 
 
+def iter_query(query, params=None, batch_size=10000):
+    """
+    流式执行查询：使用非缓冲游标，按批产出行元组列表
+    结果集再大也只在内存中保留一批，且不受 group_concat_max_len 等长度限制
+    """
+    try:
+        with get_connection() as conn:
+            cursor = _stream_cursor(conn)
+            try:
+                if params:
+                    cursor.execute(_sql(query), params)
+                else:
+                    cursor.execute(query)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                # 调用方提前结束迭代时丢弃剩余结果，连接才能归还连接池
+                _discard_unread(conn)
+                cursor.close()
+    except Exception as e:
+        raise Exception(f"执行查询失败: {str(e)}")
+
+
 # =========================================================
 # 主键相关工具
 # =========================================================
-def create_compare_index(table: str, pk_cols: list):
-    """给 _pk_concat 建索引"""
-    idx_name = f"idx_{table}_pk"
-    col_str = ",".join([f"`{c}`" for c in pk_cols])
-    sql = f"ALTER TABLE `{table}` ADD UNIQUE INDEX {idx_name} ({col_str})"
+def iter_rows_by_pk(table: str, pk_cols: list, wanted_keys: set, page_size=10000):
+    """
+    根据主键拉取行，按页产出 DataFrame
+    主键先批量写入带主键索引的临时键表再 JOIN，避免 IN (%s,%s,...) 超长语句撑爆 max_allowed_packet
+    """
+    if not wanted_keys:
+        return
+    key_col = pk_cols[0]
     try:
-        execute_query(sql)
-    except Exception:
-        pass  # 已存在
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            _create_wanted_keys(cursor, key_col, wanted_keys)
+            conn.commit()
+            cursor.close()
+
+            cursor = _stream_cursor(conn)
+            try:
+                cursor.execute(f"""
+                SELECT t.* FROM `{table}` t
+                INNER JOIN `_wanted_keys` k ON t.`{key_col}` = k.`{key_col}`
+                ORDER BY t.`id`
+                """)
+                columns = [desc[0] for desc in cursor.description]
+                while True:
+                    rows = cursor.fetchmany(page_size)
+                    if not rows:
+                        break
+                    yield pd.DataFrame(rows, columns=columns)
+            finally:
+                _discard_unread(conn)
+                cursor.close()
+            conn.cursor().execute(_drop_wanted_keys_sql())
+    except Exception as e:
+        raise Exception(f"按主键拉取数据失败: {str(e)}")
 
 
-def add_concat_pk_column(table: str, expr: str):
-    """给表增加 _pk_concat 列并填充"""
-    try:
-        execute_query(f"ALTER TABLE `{table}` ADD COLUMN `_pk_concat` VARCHAR(255)")
-    except Exception:
-        pass
-    execute_query(f"UPDATE `{table}` SET `_pk_concat` = {expr}")
+def _drop_wanted_keys_sql():
+    return ("DROP TABLE IF EXISTS temp.`_wanted_keys`" if _is_sqlite()
+            else "DROP TEMPORARY TABLE IF EXISTS `_wanted_keys`")
+
+
+def _create_wanted_keys(cursor, key_col, wanted_keys):
+    """
+    主键批量写入带主键索引的临时键表 _wanted_keys
+    临时表只对当前连接可见，键表写入和 JOIN 必须在同一个连接上完成
+    """
+    cursor.execute(_drop_wanted_keys_sql())
+    if _is_sqlite():
+        cursor.execute(f"CREATE TEMP TABLE `_wanted_keys` (`{key_col}` VARCHAR(255) PRIMARY KEY)")
+    else:
+        cursor.execute(f"""
+        CREATE TEMPORARY TABLE `_wanted_keys` (
+            `{key_col}` VARCHAR(255) PRIMARY KEY
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """)
+    if wanted_keys:
+        _bulk_load(cursor, '_wanted_keys', [key_col], [(k,) for k in wanted_keys])
 
 
 def fetch_rows_by_pk(table: str, pk_cols: list, wanted_keys: set):
-    """根据 _pk_concat 拉取行"""
-    if not wanted_keys:
+    """根据 _pk_concat 拉取行（逐页读取后合并）"""
+    pages = list(iter_rows_by_pk(table, pk_cols, wanted_keys))
+    if not pages:
         return pd.DataFrame()
-    keys = list(wanted_keys)
-    placeholders = ",".join(["%s"] * len(keys))
-    sql = f"SELECT * FROM `{table}` WHERE _pk_concat IN ({placeholders})"
-    return execute_query(sql, params=keys)
+    return pd.concat(pages, ignore_index=True)
+
+
+# =========================================================
+# 导入仓库（增量比对）
+# =========================================================
+def init_import_store():
+    """创建导入仓库的登记表（已存在则保留，跨次比对复用）"""
+    suffix = "" if _is_sqlite() else " ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+    with get_connection(autocommit=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {IMPORT_STORE_TABLE} (
+            `fingerprint` CHAR(64) PRIMARY KEY,
+            `source` VARCHAR(512),
+            `table_name` VARCHAR(64),
+            `row_count` INT,
+            `created_at` DOUBLE
+        ){suffix}""")
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {COMPARE_RUNS_TABLE} (
+            `run_id` CHAR(64) PRIMARY KEY,
+            `fp1` CHAR(64),
+            `fp2` CHAR(64),
+            `source` VARCHAR(1024),
+            `created_at` DOUBLE
+        ){suffix}""")
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {COMPARE_DIFF_KEYS_TABLE} (
+            `run_id` CHAR(64),
+            `_pk_concat` VARCHAR(255),
+            PRIMARY KEY (`run_id`, `_pk_concat`)
+        ){suffix}""")
+
+
+def fingerprint_sheet(file_path, sheet_name, *signature):
+    """
+    工作表的内容指纹：文件内容 SHA-256 + 工作表名 + 影响导入结果的参数（跳过行数、列类型、规则等）
+    任一变化都会得到新的指纹，对应一张新的导入表
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    key = hashlib.sha256(digest.digest())
+    for part in (_IMPORT_STORE_VERSION, DB_ENGINE, sheet_name) + signature:
+        key.update(b'\x1f' + str(part).encode('utf-8'))
+    return key.hexdigest()
+
+
+def store_table_name(fingerprint):
+    return f"store_{fingerprint[:16]}"
+
+
+def find_import(fingerprint):
+    """已导入过相同内容时返回 (表名, 行数)，否则返回 None"""
+    df = execute_query(f"SELECT `table_name`, `row_count` FROM {IMPORT_STORE_TABLE} WHERE `fingerprint` = %s",
+                       (fingerprint,))
+    if df.empty:
+        return None
+    return df.iat[0, 0], int(df.iat[0, 1])
+
+
+def register_import(fingerprint, source, table_name, row_count):
+    """
+    登记（或刷新）一次导入；同一来源只保留最近 IMPORT_STORE_KEEP 份，
+    更早的导入表及引用它们的比对记录一并删除
+    """
+    try:
+        with get_connection(autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(_sql(f"DELETE FROM {IMPORT_STORE_TABLE} WHERE `fingerprint` = %s"), (fingerprint,))
+            cursor.execute(_sql(f"""
+            INSERT INTO {IMPORT_STORE_TABLE} (`fingerprint`, `source`, `table_name`, `row_count`, `created_at`)
+            VALUES (%s, %s, %s, %s, %s)"""), (fingerprint, source, table_name, row_count, time.time()))
+            cursor.execute(_sql(f"""
+            SELECT `fingerprint`, `table_name` FROM {IMPORT_STORE_TABLE}
+            WHERE `source` = %s ORDER BY `created_at` DESC"""), (source,))
+            expired = cursor.fetchall()[IMPORT_STORE_KEEP:]
+            for old_fp, old_table in expired:
+                cursor.execute(f"DROP TABLE IF EXISTS `{old_table}`")
+                cursor.execute(_sql(f"DELETE FROM {IMPORT_STORE_TABLE} WHERE `fingerprint` = %s"), (old_fp,))
+                cursor.execute(_sql(f"""
+                DELETE FROM {COMPARE_DIFF_KEYS_TABLE} WHERE `run_id` IN (
+                    SELECT `run_id` FROM {COMPARE_RUNS_TABLE} WHERE `fp1` = %s OR `fp2` = %s)"""),
+                               (old_fp, old_fp))
+                cursor.execute(_sql(f"DELETE FROM {COMPARE_RUNS_TABLE} WHERE `fp1` = %s OR `fp2` = %s"),
+                               (old_fp, old_fp))
+    except Exception as e:
+        raise Exception(f"登记导入记录失败: {str(e)}")
+
+
+def changed_keys(old_table, new_table):
+    """
+    两次导入之间变化的主键：行哈希不同、新增或删除的 _pk_concat
+    两表都有 _pk_concat 索引，各扫描一次另一侧走索引查找
+    """
+    sql = f"""
+    SELECT n._pk_concat FROM `{new_table}` n
+    WHERE NOT EXISTS (SELECT 1 FROM `{old_table}` o
+                      WHERE o._pk_concat = n._pk_concat AND o.{ROW_HASH_COLUMN} = n.{ROW_HASH_COLUMN})
+    UNION
+    SELECT o._pk_concat FROM `{old_table}` o
+    WHERE NOT EXISTS (SELECT 1 FROM `{new_table}` n
+                      WHERE n._pk_concat = o._pk_concat AND n.{ROW_HASH_COLUMN} = o.{ROW_HASH_COLUMN})
+    """
+    keys = set()
+    for rows in iter_query(sql):
+        keys.update(key for key, in rows if key is not None)
+    return keys
+
+
+def compare_run_id(fp1, fp2):
+    return hashlib.sha256(f"{fp1}:{fp2}".encode('ascii')).hexdigest()
+
+
+def latest_compare_run(source):
+    """
+    同一对来源最近一次比对：返回 (表一指纹, 表二指纹, 差异主键集合)，
+    两侧导入表都还在仓库中才可用于增量比对，否则返回 None
+    """
+    df = execute_query(f"""
+    SELECT r.`run_id`, r.`fp1`, r.`fp2` FROM {COMPARE_RUNS_TABLE} r
+    WHERE r.`source` = %s
+      AND EXISTS (SELECT 1 FROM {IMPORT_STORE_TABLE} s WHERE s.`fingerprint` = r.`fp1`)
+      AND EXISTS (SELECT 1 FROM {IMPORT_STORE_TABLE} s WHERE s.`fingerprint` = r.`fp2`)
+    ORDER BY r.`created_at` DESC LIMIT 1""", (source,))
+    if df.empty:
+        return None
+    run_id, fp1, fp2 = df.iloc[0]
+    keys = execute_query(f"SELECT `_pk_concat` FROM {COMPARE_DIFF_KEYS_TABLE} WHERE `run_id` = %s", (run_id,))
+    return fp1, fp2, set(keys['_pk_concat']) if not keys.empty else set()
+
+
+def save_compare_run(fp1, fp2, source, diff_keys):
+    """记录本次比对的差异主键，供下次增量比对"""
+    run_id = compare_run_id(fp1, fp2)
+    try:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(_sql(f"DELETE FROM {COMPARE_DIFF_KEYS_TABLE} WHERE `run_id` = %s"), (run_id,))
+            cursor.execute(_sql(f"DELETE FROM {COMPARE_RUNS_TABLE} WHERE `run_id` = %s"), (run_id,))
+            cursor.execute(_sql(f"""
+            INSERT INTO {COMPARE_RUNS_TABLE} (`run_id`, `fp1`, `fp2`, `source`, `created_at`)
+            VALUES (%s, %s, %s, %s, %s)"""), (run_id, fp1, fp2, source, time.time()))
+            rows = [(run_id, key) for key in set(diff_keys) if key is not None]
+            if rows:
+                _bulk_load(cursor, COMPARE_DIFF_KEYS_TABLE, ['run_id', '_pk_concat'], rows)
+            conn.commit()
+    except Exception as e:
+        raise Exception(f"保存比对记录失败: {str(e)}")
 
 
 # =========================================================
 # 清理
 # =========================================================
+def clear_import_store():
+    """
+    清空导入仓库：删除全部 store_* 导入表（含中途失败留下的残表）和登记表，返回删除的导入表数量
+    登记表在下次 init_database 时重新创建
+    """
+    try:
+        if _is_sqlite():
+            query = "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'store!_%' ESCAPE '!'"
+        else:
+            query = ("SELECT TABLE_NAME FROM information_schema.TABLES "
+                     "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE 'store!_%' ESCAPE '!'")
+        with get_connection(autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(query)
+            tables = [row[0] for row in cursor.fetchall()]
+            for table in tables:
+                cursor.execute(f"DROP TABLE IF EXISTS `{table}`")
+            for table in (IMPORT_STORE_TABLE, COMPARE_RUNS_TABLE, COMPARE_DIFF_KEYS_TABLE):
+                cursor.execute(f"DROP TABLE IF EXISTS `{table}`")
+        return len(tables)
+    except Exception as e:
+        raise Exception(f"清空导入仓库失败: {e}")
+
+
 def drop_tables():
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        cursor.execute("DROP TABLE IF EXISTS temp_table1")
-        cursor.execute("DROP TABLE IF EXISTS temp_table2")
-        conn.commit()
-        conn.close()
+        with get_connection(autocommit=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute("DROP TABLE IF EXISTS temp_table1")
+            cursor.execute("DROP TABLE IF EXISTS temp_table2")
     except Exception as e:
         print(f"删除表失败: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,160 @@
+# exporter.py
+"""
+比对报告导出：两个文件各在一个子进程中流式写出（单元格转文本和 xlsx 序列化是 CPU 密集型），
+ExportWorker 在后台线程中调度子进程并回传每个文件已写出的行数，界面不阻塞，可随时取消
+"""
+import os
+import time
+import threading
+from pathlib import Path
+import pandas as pd
+import xlsxwriter
+from PyQt5.QtCore import QThread, pyqtSignal
+from data_handler import iter_excel_chunks, cached_sheet_rows, estimate_sheet_rows, parse_workers, cell_text
+from process_pool import run_sides, Cancelled
+from result_index import ResultIndex, RESULT_COLUMN, STATUS_LABELS, STATUS_EQUAL
+from result_store import DiffTable
+
+
+def report_path(src_file, out_dir):
+    return Path(out_dir) / f"{Path(src_file).stem}_比对结果.xlsx"
+
+
+def export_sheet(src_file, sheet_name, is_first_file, out_dir, result_index, key_builder, skip_rows=0,
+                 chunk_size=5000, progress_callback=None, workers=None):
+    """
+    流式导出：按块读取原表（命中比对时的解析缓存），逐行追加对比列后用 write_row 写出
+    xlsxwriter 使用 constant_memory 模式，内存占用只与一块数据有关，与表的行数无关
+    每块用 key_builder 算出 _pk_concat，从 result_index 整列取回对比结果和各字段差异说明
+    progress_callback 每写完一块以累计行数回调，返回写出的行数
+    workers: 未命中解析缓存时分片解析的进程数
+    """
+    dst = report_path(src_file, out_dir)
+    equal_label = STATUS_LABELS[STATUS_EQUAL]
+
+    # 需要追加的列（顺序 = 规则顺序）
+    comp_cols = result_index.fields
+
+    # 边读边写：不改动原列，仅追加
+    chunks = iter_excel_chunks(src_file, sheet_name, is_file1=is_first_file,
+                               skip_rows=skip_rows, chunk_size=chunk_size, workers=workers)
+    with xlsxwriter.Workbook(dst, {'constant_memory': True, 'nan_inf_to_errors': True}) as wb:
+        ws = wb.add_worksheet(sheet_name)
+        header_fmt = wb.add_format({'bold': True, 'bg_color': '#FFC7CE'})
+        red_fmt = wb.add_format({'bg_color': '#FF0000', 'font_color': '#FFFFFF'})
+
+        r = 0
+        for chunk in chunks:
+            orig_cols = chunk.shape[1]
+            if r == 0:
+                ws.write_row(0, 0, [str(c) for c in chunk.columns] + [RESULT_COLUMN] + comp_cols, header_fmt)
+                r = 1
+            if chunk.empty:
+                continue
+            # 全部转成字符串，防类型问题
+            df = pd.DataFrame({i: cell_text(chunk.iloc[:, i]) for i in range(orig_cols)}).set_axis(chunk.columns, axis=1)
+            labels, details, hit = result_index.lookup(key_builder(chunk))
+            details = list(zip(*[details[fld] for fld in comp_cols])) if comp_cols else None
+
+            for i, values in enumerate(df.itertuples(index=False, name=None)):
+                ws.write_row(r, 0, values)
+                result = labels[i]
+                ws.write(r, orig_cols, result, red_fmt if result != equal_label else None)
+                if hit[i] and details:
+                    for c, val in enumerate(details[i], start=orig_cols + 1):
+                        if val:
+                            ws.write(r, c, val, red_fmt)
+                r += 1
+            if progress_callback:
+                progress_callback(r - 1)
+    return r - 1 if r else 0
+
+
+def _export_job(progress_callback=None, **kwargs):
+    """子进程入口：单个文件失败不影响另一个文件，返回 (行数, 错误信息)；取消则继续上抛"""
+    try:
+        return export_sheet(progress_callback=progress_callback, **kwargs), None
+    except Cancelled:
+        raise
+    except Exception as e:
+        return 0, str(e)
+
+
+class ExportWorker(QThread):
+    """后台导出：tasks 为 [(源文件, 页签, 是否平台表), ...]，每个文件一个子进程"""
+    log_signal = pyqtSignal(str)
+    progress_signal = pyqtSignal(int)  # 总进度 0~100，行数未知时不发送
+    file_progress_signal = pyqtSignal(str, int)  # 文件名, 已写出行数
+
+    def __init__(self, compare_worker, tasks, out_dir, parallel=True):
+        super().__init__()
+        self.out_dir = out_dir
+        self.parallel = parallel
+        self.skip_rows = compare_worker.skip_rows
+        self.chunk_size = compare_worker.chunk_size
+        self.tasks = tasks
+        self.key_builder = compare_worker.key_builder
+        self.result_index = compare_worker.result_index
+        if self.result_index is None:
+            # 没有共同主键时比对提前结束，只有缺失/多余结果
+            self.result_index = ResultIndex.build(compare_worker.rules, DiffTable.empty(), compare_worker.missing_rows,
+                                                  compare_worker.extra_in_file2)
+        self.cancelled = False
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """请求取消；子进程在写完当前块后退出"""
+        self._cancel.set()
+
+    def _skip_rows(self, is_first_file):
+        return 0 if is_first_file else self.skip_rows
+
+    def _total_rows(self, src_file, sheet_name, is_first_file):
+        """已解析过的页签取缓存中的行数，否则按页签 <dimension> 估算，都不可用时返回 0"""
+        rows = cached_sheet_rows(src_file, sheet_name, is_file1=is_first_file,
+                                 skip_rows=self._skip_rows(is_first_file), chunk_size=self.chunk_size)
+        if rows is None:
+            rows = estimate_sheet_rows(src_file, sheet_name)
+        return rows or 0
+
+    def run(self):
+        start = time.time()
+        jobs, names, totals = {}, {}, {}
+        workers = parse_workers(len(self.tasks) if self.parallel else 1)  # 各文件同时解析时平分进程数
+        for src_file, sheet_name, is_first_file in self.tasks:
+            names[src_file] = Path(src_file).name
+            totals[src_file] = self._total_rows(src_file, sheet_name, is_first_file)
+            jobs[src_file] = (_export_job, dict(
+                src_file=src_file, sheet_name=sheet_name, is_first_file=is_first_file, out_dir=self.out_dir,
+                result_index=self.result_index, key_builder=self.key_builder(is_first_file),
+                skip_rows=self._skip_rows(is_first_file), chunk_size=self.chunk_size, workers=workers))
+        done = dict.fromkeys(jobs, 0)
+        grand_total = sum(totals.values())
+
+        def progress(src_file, rows):
+            done[src_file] = rows
+            self.file_progress_signal.emit(names[src_file], rows)
+            if grand_total:
+                self.progress_signal.emit(min(99, int(sum(done.values()) * 100 / grand_total)))
+
+        try:
+            results = run_sides(jobs, progress=progress, parallel=self.parallel, cancel=self._cancel)
+        except Cancelled:
+            self.cancelled = True
+            for src_file in jobs:
+                dst = report_path(src_file, self.out_dir)
+                if dst.exists():
+                    os.remove(dst)
+            self.log_signal.emit("⚠️ 已取消导出")
+            return
+        except Exception as e:
+            self.log_signal.emit(f"❌ 导出失败: {e}")
+            return
+
+        for src_file, (rows, error) in results.items():
+            if error:
+                self.log_signal.emit(f"❌ 导出失败 {names[src_file]}: {error}")
+            else:
+                self.log_signal.emit(f"✅ 导出完成 {report_path(src_file, self.out_dir).name}（{rows} 行）")
+        self.progress_signal.emit(100)
+        self.log_signal.emit(f"✅ 并行导出完成，总耗时 {time.time() - start:.1f}s")
@@ -1,20 +1,23 @@
 # main.py
 import sys
 import traceback
+import multiprocessing
 import logging
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QApplication
 from ui_components import ExcelComparer, exception_hook
 from utils import resource_path
 
-# 配置日志记录器
+# 配置日志记录器（WARNING 起记录，导入方式回退等提示也写入日志文件；子进程同样执行此配置）
 logging.basicConfig(
     filename="./error_log.txt",
-    level=logging.ERROR,
+    level=logging.WARNING,
     format="%(asctime)s - %(levelname)s - %(message)s"
 )
 
 if __name__ == "__main__":
+    # 打包成 exe 后，两表并行导入的子进程需要由此进入
+    multiprocessing.freeze_support()
     sys.excepthook = exception_hook
     app = QApplication(sys.argv)
     icon_path = resource_path('icon.ico')
@@ -0,0 +1,196 @@
+# memory_comparator.py
+"""
+内存比对引擎：不经过 MySQL，直接用 pandas 哈希连接完成主键归属和逐字段差异判断
+规则语义与 CompareWorker 生成的 SQL 保持一致（尾差、折旧取绝对值、资产分类映射前两位、折旧方法归一、日期归一）
+文本比较与 SQL 相同：只去掉首尾的半角空格（同 TRIM），不区分大小写（SQL 两侧都取 LOWER，
+与 MySQL utf8mb4 默认排序规则一致）；MySQL 排序规则另外忽略重音、全半角等差异，这部分两个引擎不做处理
+"""
+import numpy as np
+import pandas as pd
+from data_handler import iter_excel_chunks, sanitize_column_name, prepare_columns
+from rule_handler import PK_COLUMN, CATEGORY_CODE_COLUMN
+from rule_expr import compile_rule
+from result_store import RowTable, DiffTable
+
+
+# =========================================================
+# 读取
+# =========================================================
+def load_sheet(file_path, sheet_name, column_types, computed_columns, is_file1=True, skip_rows=0, chunk_size=5000,
+               progress_callback=None, workers=None):
+    """
+    逐块读取并按规则类型整理成一张内存表，列与 import_excel_to_db 写入 MySQL 的一致：
+    id（从 1 开始的行号）、各数据列、computed_columns 中的附加列；数值列转成 float，其余列为字符串，空值为 None
+    progress_callback: 每块读完后以累计行数回调
+    workers: 分片解析的进程数（见 iter_excel_chunks）
+    返回 (DataFrame, {列名: 无法识别为数值/日期而记为空的单元格数})
+    """
+    types = {sanitize_column_name(c): t for c, t in column_types.items()}
+    coerced = {}
+    frames = []
+    offset = 0
+    for chunk in iter_excel_chunks(file_path, sheet_name, is_file1=is_file1,
+                                   skip_rows=skip_rows, chunk_size=chunk_size, workers=workers):
+        chunk.columns = [sanitize_column_name(col) for col in chunk.columns]
+        columns = list(chunk.columns)
+        prepared = prepare_columns(chunk, types, abs_depreciation=not is_file1, coerced=coerced)
+        index = pd.RangeIndex(offset, offset + len(chunk))
+        frame = pd.DataFrame({col: pd.Series(values.to_numpy(), index=index)
+                              for col, values in zip(columns, prepared)})
+        for name, (_, func) in computed_columns.items():
+            frame[name] = func(frame)
+        frames.append(frame)
+        offset += len(chunk)
+        if progress_callback:
+            progress_callback(offset)
+
+    df = pd.concat(frames) if frames else pd.DataFrame()
+    for col, data_type in types.items():
+        if data_type == "数值" and col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    df.insert(0, 'id', np.arange(1, len(df) + 1))
+    return df, coerced
+
+
+def add_calculated_fields(df, rules):
+    """表二按编译后的计算规则补 _calc_ 列：数值结果空值/除零记 0，与 SQL 的 COALESCE 一致"""
+    for field_name, rule in rules.items():
+        calc_rule = rule.get("calc_rule")
+        data_type = rule.get("data_type")
+        if not calc_rule or data_type not in ("数值", "文本"):
+            continue
+        value = compile_rule(calc_rule, data_type).evaluate(df)
+        if data_type == "数值":
+            value = value.fillna(0.0)
+            if "折旧" in field_name:
+                value = value.abs()
+            value = value.round(6)
+        df[f"_calc_{field_name}"] = value
+    return df
+
+
+def _column(df, name):
+    if name not in df.columns:
+        raise Exception(f"表中不存在字段：{name}")
+    return df[name]
+
+
+# =========================================================
+# 比对
+# =========================================================
+def classify_keys(df1, df2):
+    """返回 (共同主键, 表二缺失主键, 表二多余主键)，空主键不参与匹配"""
+    keys1 = set(df1[PK_COLUMN].dropna())
+    keys2 = set(df2[PK_COLUMN].dropna())
+    return keys1 & keys2, keys1 - keys2, keys2 - keys1
+
+
+def rows_by_keys(df, keys):
+    """按主键取整行，顺序与原表一致"""
+    if not keys:
+        return RowTable()
+    return RowTable(df[df[PK_COLUMN].isin(keys)])
+
+
+def compare_fields(df1, df2, rules, primary_keys):
+    """
+    共同主键按 _pk_concat 内连接后逐字段算差异掩码，返回与 _compare_fields_in_db 相同的 DiffTable
+    """
+    pairs = pd.merge(
+        pd.DataFrame({PK_COLUMN: df1[PK_COLUMN].to_numpy(), '_i1': np.arange(len(df1))}),
+        pd.DataFrame({PK_COLUMN: df2[PK_COLUMN].to_numpy(), '_i2': np.arange(len(df2))}),
+        on=PK_COLUMN, how='inner'
+    )
+    fields = [f for f, r in rules.items() if not r.get("is_primary")]
+    if pairs.empty:
+        return DiffTable.empty(fields)
+    idx1 = pairs['_i1'].to_numpy()
+    idx2 = pairs['_i2'].to_numpy()
+
+    def src(col):
+        return _column(df1, col).iloc[idx1].reset_index(drop=True)
+
+    def tgt(col):
+        return _column(df2, col).iloc[idx2].reset_index(drop=True)
+
+    src_cols, tgt_cols, field_masks = {}, {}, {}
+    for field_name in fields:
+        rule = rules[field_name]
+        data_type = rule.get("data_type", "文本")
+        if rule.get("calc_rule") and data_type in ("数值", "文本"):
+            tgt_name = f"_calc_{field_name}"
+        else:
+            tgt_name = rule.get("table2_field", field_name)
+        s = src_cols[field_name] = src(field_name)
+        if field_name == "资产分类" and data_type == "文本":
+            # 资产分类实际与表二“资产明细类别”比较，映射字段只用于展示
+            t = tgt(tgt_name) if tgt_name in df2.columns else pd.Series(None, index=pairs.index, dtype=object)
+        else:
+            t = tgt(tgt_name)
+        tgt_cols[field_name] = t
+
+        if data_type == "数值":
+            mask = _numeric_diff(s, t, rule.get("tail_diff"), "折旧" in field_name)
+        elif data_type == "日期":
+            # 与 SQL 一致：任一侧为空时不计为差异
+            mask = s.notna() & t.notna() & (s != t)
+        elif data_type == "文本" and field_name == "资产分类":
+            detail = tgt("资产明细类别")
+            tgt_cols["资产明细类别"] = detail
+            mapped = src_cols[CATEGORY_CODE_COLUMN] = src(CATEGORY_CODE_COLUMN)
+            mask = ~(_blank(s) & _blank(detail))
+            mask &= s.notna() & (mapped.str[:2].str.lower() != detail.fillna('').str[:2].str.lower())
+        elif data_type == "文本":
+            tgt_text = _trim(t)
+            if "折旧方法" in field_name:
+                tgt_text = tgt_text.replace('直线法', '年限平均法')
+            mask = ~(_blank(s) & _blank(t))
+            mask &= _trim(s).str.lower() != tgt_text.str.lower()
+        else:
+            mask = ~(_blank(s) & _blank(t))
+            mask &= s.fillna('').astype(str).str.lower() != t.fillna('').astype(str).str.lower()
+        field_masks[field_name] = mask.fillna(False).astype(bool)
+
+    if not field_masks:
+        return DiffTable.empty()
+    flags = pd.DataFrame(field_masks)
+    hit = np.flatnonzero(flags.any(axis=1).to_numpy())
+    if not len(hit):
+        return DiffTable.empty(list(flags.columns))
+
+    # 表二按 _pk_concat 与表一匹配，不一定有同名主键列，两侧主键值都取表一
+    pk_frame = pd.DataFrame({pk: src(pk) for pk in primary_keys})
+    src_frame = pd.concat([pk_frame, pd.DataFrame(src_cols)], axis=1).iloc[hit]
+    tgt_frame = pd.concat([pk_frame, pd.DataFrame(tgt_cols)], axis=1).iloc[hit]
+    return DiffTable(pairs[PK_COLUMN].to_numpy()[hit], src_frame, tgt_frame,
+                     flags.to_numpy()[hit], list(flags.columns))
+
+
+def _trim(series):
+    """空值记 ''，只去掉首尾半角空格（与 SQL 的 TRIM 一致，制表符、全角空格保留）"""
+    return series.fillna('').astype(str).str.strip(' ')
+
+
+def _blank(series):
+    return series.isna() | (series.astype(str) == '')
+
+
+def _round_half_up(values, digits):
+    """与 MySQL 对 DECIMAL 的 ROUND 一致：四舍五入远离 0"""
+    factor = 10 ** digits
+    return np.sign(values) * np.floor(np.abs(values) * factor + 0.5) / factor
+
+
+def _numeric_diff(s, t, tail_diff, is_depreciation):
+    both_null = s.isna() & t.isna()
+    a, b = s.fillna(0.0), t.fillna(0.0)
+    tail = float(tail_diff or 0)
+    if is_depreciation:
+        a, b = a.abs(), b.abs()
+        mask = (a - b).abs() > tail if tail > 0 else a != b
+    elif tail > 0:
+        digits = int(tail)
+        mask = (_round_half_up(a, digits) - _round_half_up(b, digits)).abs() > tail
+    else:
+        mask = a != b
+    return ~both_null & mask
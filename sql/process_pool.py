@@ -0,0 +1,88 @@
+# process_pool.py
+"""
+两侧独立任务（平台表 / ERP 表的解析与导入、报告导出）放到子进程中并行执行
+Excel 解析和写出是 CPU 密集型，线程受 GIL 限制无法并行，因此每侧一个进程；
+子进程通过队列回传已处理行数，调用线程据此汇报进度；取消标志在子进程回报进度时检查
+"""
+import os
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+_progress_queue = None  # 子进程内的进度队列，由 _init_process 设置
+_cancel_flag = None  # 子进程内的取消标志
+
+
+class Cancelled(Exception):
+    """任务被调用方取消"""
+
+
+def _init_process(progress_queue, cancel_flag, setup, setup_args):
+    global _progress_queue, _cancel_flag
+    _progress_queue = progress_queue
+    _cancel_flag = cancel_flag
+    if setup is not None:
+        setup(*setup_args)
+
+
+def _report(side, rows):
+    if _cancel_flag.is_set():
+        raise Cancelled("已取消")
+    _progress_queue.put((side, rows))
+
+
+def _run_job(side, func, kwargs):
+    """子进程入口：func 须为模块级函数，接受 progress_callback(已处理行数)"""
+    return func(progress_callback=lambda rows: _report(side, rows), **kwargs)
+
+
+def run_sides(jobs, progress=None, parallel=True, setup=None, setup_args=(), poll_interval=0.2, cancel=None):
+    """
+    jobs: {side: (func, kwargs)}，返回 {side: func 的返回值}
+    progress(side, rows) 在调用线程中回调；setup(*setup_args) 在每个子进程启动时执行（如同步数据库配置）
+    cancel: threading.Event，置位后各任务在下一次回报进度时抛出 Cancelled
+    parallel=False 或只有一个任务时在当前进程依次执行；任一任务出错时抛出其异常
+    """
+    if not parallel or len(jobs) < 2:
+        results = {}
+        for side, (func, kwargs) in jobs.items():
+            def callback(rows, s=side):
+                if cancel is not None and cancel.is_set():
+                    raise Cancelled("已取消")
+                if progress:
+                    progress(s, rows)
+            results[side] = func(progress_callback=callback, **kwargs)
+        return results
+
+    ctx = multiprocessing.get_context()
+    progress_queue = ctx.Queue()
+    cancel_flag = ctx.Event()
+    workers = min(len(jobs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_process,
+                             initargs=(progress_queue, cancel_flag, setup, setup_args)) as pool:
+        futures = {pool.submit(_run_job, side, func, kwargs): side for side, (func, kwargs) in jobs.items()}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                cancel_flag.set()
+            _drain(progress_queue, progress)
+            for future in done:
+                if future.exception() is not None:
+                    # 另一侧若已在运行，置取消标志让它在下一次回报进度时退出，不必等它整个跑完
+                    cancel_flag.set()
+                    for other in pending:
+                        other.cancel()
+                    raise future.exception()
+        _drain(progress_queue, progress)
+        return {side: future.result() for future, side in futures.items()}
+
+
+def _drain(progress_queue, progress):
+    while True:
+        try:
+            side, rows = progress_queue.get_nowait()
+        except queue.Empty:
+            return
+        if progress:
+            progress(side, rows)
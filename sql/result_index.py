@@ -0,0 +1,143 @@
+# result_index.py
+"""
+比对结果索引：CompareWorker 比对完成后按 _pk_concat 建立一次，
+每个主键一个状态码，外加各字段的差异说明（只保存有结果的主键，不在索引中的视为一致）；
+导出时按块算出 _pk_concat，用 get_indexer 一次取回整列，不再逐行拼主键、查字典
+"""
+import numpy as np
+import pandas as pd
+from rule_handler import PK_COLUMN, CATEGORY_CODE_COLUMN
+from data_handler import cell_text
+
+RESULT_COLUMN = "对比结果"
+STATUS_EQUAL, STATUS_DIFF, STATUS_MISSING, STATUS_EXTRA = 0, 1, 2, 3
+# 状态码 -> 对比结果文本：缺失即平台表有而 ERP 表没有，多余反之
+STATUS_LABELS = np.array(["一致", "不一致", "此数据不存在于SAP", "此数据不存在于平台"], dtype=object)
+
+
+def _normalize(values):
+    """统一空值表示（与 normalize_value 一致）：空值、空白为 ''，其余去首尾空白"""
+    series = pd.Series(values, dtype=object)
+    return series.astype(str).str.strip().where(series.notna(), '')
+
+
+def _tail_digits(rule):
+    try:
+        return int(float(rule.get("tail_diff") or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _format_numbers(values, digits):
+    """
+    数值差异说明的显示，与比对日志一致：设了尾差按尾差位数，否则整数值不带小数
+    各引擎取回的类型不同（MySQL 为 Decimal，sqlite/内存为 float），统一先转 float，显示才一致
+    """
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype(float)
+    if digits > 0:
+        text = numbers.map(lambda v: f"{v:.{digits}f}")
+    else:
+        text = cell_text(numbers)
+    return text.where(numbers.notna(), '')
+
+
+def _detail_values(rule, values):
+    """差异说明中显示的取值：数值列按 _format_numbers，其余按 _normalize"""
+    if rule.get("data_type") == "数值":
+        return _format_numbers(values, _tail_digits(rule))
+    return _normalize(values)
+
+
+class ResultIndex:
+    """
+    keys: 唯一的 _pk_concat 索引；status: 与 keys 对齐的 int8 状态码
+    details: {字段: 与 keys 对齐的 object 数组}，判定不一致时为说明文本，否则为 ''
+    """
+
+    def __init__(self, keys, status, details):
+        self.keys = keys
+        self.status = status
+        self.details = details
+        self._key_rank = None
+
+    @property
+    def fields(self):
+        """追加的差异列，规则顺序，不含主键"""
+        return list(self.details)
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def build(cls, rules, diffs, missing_rows, extra_rows):
+        """
+        diffs 为 DiffTable，missing_rows / extra_rows 为 RowTable，均按列读取
+        同一主键出现多次时，缺失优先于多余，多余优先于不一致（与原先逐行判断的顺序一致）
+        """
+        fields = [f for f, r in rules.items() if not r.get("is_primary")]
+        n_diff = len(diffs)
+        keys = np.concatenate([diffs.keys,
+                               np.asarray(extra_rows.column(PK_COLUMN), dtype=object),
+                               np.asarray(missing_rows.column(PK_COLUMN), dtype=object)])
+        status = np.concatenate([np.full(n_diff, STATUS_DIFF, dtype=np.int8),
+                                 np.full(len(extra_rows), STATUS_EXTRA, dtype=np.int8),
+                                 np.full(len(missing_rows), STATUS_MISSING, dtype=np.int8)])
+
+        details = {}
+        for fld in fields:
+            flagged = diffs.field_flags(fld)
+            if fld == "资产分类" and rules[fld].get("data_type") == "文本":
+                # 资产分类按映射编码与表二“资产明细类别”的前两位判定，说明中显示实际比较的编码
+                src = _normalize(diffs.values("source", CATEGORY_CODE_COLUMN))
+                tgt = _normalize(diffs.values("target", "资产明细类别"))
+                text = "不一致（编码前两位）：平台表=" + src + ", ERP表=" + tgt
+            else:
+                src = _detail_values(rules[fld], diffs.values("source", fld))
+                tgt = _detail_values(rules[fld], diffs.values("target", fld))
+                text = "不一致：平台表=" + src + ", ERP表=" + tgt
+            text = text.where(flagged, '')
+            column = np.full(len(keys), '', dtype=object)
+            column[:n_diff] = text.to_numpy(dtype=object)
+            details[fld] = column
+
+        index = pd.Index(keys, dtype=object)
+        keep = ~index.duplicated(keep='last')
+        return cls(index[keep], status[keep], {fld: col[keep] for fld, col in details.items()})
+
+    def select(self, status=None, field=None):
+        """按状态码、差异字段筛选，返回满足条件的位置数组（保持索引中的顺序）"""
+        mask = np.ones(len(self.keys), dtype=bool)
+        if status is not None:
+            mask &= self.status == status
+        if field is not None:
+            mask &= self.details[field] != ''
+        return np.flatnonzero(mask)
+
+    def sort_by_key(self, positions, descending=False):
+        """按主键文本排序位置数组；各主键的名次只算一次"""
+        if self._key_rank is None:
+            order = pd.Series(self.keys, dtype=object).fillna('').astype(str).to_numpy().argsort(kind='stable')
+            self._key_rank = np.empty(len(order), dtype=np.int64)
+            self._key_rank[order] = np.arange(len(order))
+        ranks = self._key_rank[positions]
+        return positions[np.argsort(-ranks if descending else ranks, kind='stable')]
+
+    def positions(self, keys):
+        """各主键在索引中的位置，不在索引中为 -1"""
+        return self.keys.get_indexer(pd.Index(keys, dtype=object))
+
+    def lookup(self, keys):
+        """
+        按主键整列取结果，返回 (对比结果文本数组, {字段: 差异说明数组}, 是否有结果的布尔数组)
+        不在索引中的主键为“一致”、说明为 ''
+        """
+        pos = self.positions(keys)
+        hit = pos >= 0
+        codes = np.full(len(pos), STATUS_EQUAL, dtype=np.int8)
+        codes[hit] = self.status[pos[hit]]
+        details = {}
+        for fld, column in self.details.items():
+            values = np.full(len(pos), '', dtype=object)
+            values[hit] = column[pos[hit]]
+            details[fld] = values
+        return STATUS_LABELS[codes], details, hit
@@ -0,0 +1,120 @@
+# result_store.py
+"""
+比对结果的列式存储：缺失/多余行、差异记录按列保存在 DataFrame / numpy 数组中，
+不再为每行每个字段生成 Python 字典；按下标访问时才返回只读的字典视图，
+日志等按行使用的代码仍可 len()、切片、遍历、row.get(字段)
+"""
+from collections.abc import Mapping, Sequence
+import numpy as np
+import pandas as pd
+
+
+def _py(value):
+    """单元格转成普通 Python 值，空值为 None（与 to_dict(orient='records') 后再把 NaN 换成 None 一致）"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _columns(frame):
+    """列名 -> 底层数组（不复制），供多个行视图共享"""
+    return {col: frame[col].to_numpy() for col in frame.columns}
+
+
+class RowView(Mapping):
+    """表中一行的只读字典视图，取值时才从列数组中读取"""
+    __slots__ = ('_columns', '_pos')
+
+    def __init__(self, columns, pos):
+        self._columns = columns
+        self._pos = pos
+
+    def __getitem__(self, name):
+        return _py(self._columns[name][self._pos])
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class _LazySequence(Sequence):
+    """按下标生成元素的序列：切片返回元素列表，与原先的 list 用法一致"""
+
+    def _item(self, pos):
+        raise NotImplementedError
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._item(pos) for pos in range(len(self))[index]]
+        return self._item(range(len(self))[index])
+
+
+class RowTable(_LazySequence):
+    """若干整行（缺失行、多余行），frame 为导入表中的原始列"""
+
+    def __init__(self, frame=None):
+        self.frame = pd.DataFrame() if frame is None else frame.reset_index(drop=True)
+        self._columns = _columns(self.frame)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _item(self, pos):
+        return RowView(self._columns, pos)
+
+    def column(self, name):
+        """整列取值，表中没有该列时全为 None"""
+        if name in self._columns:
+            return self._columns[name]
+        return np.full(len(self), None, dtype=object)
+
+
+class DiffTable(_LazySequence):
+    """
+    差异记录：keys 为 _pk_concat，source / target 为两侧取值（行与 keys 对齐），
+    flags 为 行数 × fields 的布尔矩阵，标记各字段是否判定不一致；
+    按下标返回 {"key", "source", "target", "diff_fields"}，与原先列表中的字典结构相同
+    """
+
+    def __init__(self, keys, source, target, flags, fields):
+        self.keys = np.asarray(keys, dtype=object)
+        self.source = source.reset_index(drop=True)
+        self.target = target.reset_index(drop=True)
+        self.flags = np.asarray(flags, dtype=bool).reshape(len(self.keys), len(fields))
+        self.fields = list(fields)
+        self._source_columns = _columns(self.source)
+        self._target_columns = _columns(self.target)
+        self._field_names = np.array(self.fields, dtype=object)
+
+    @classmethod
+    def empty(cls, fields=()):
+        return cls([], pd.DataFrame(), pd.DataFrame(), np.zeros((0, len(fields)), dtype=bool), fields)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _item(self, pos):
+        return {
+            "key": _py(self.keys[pos]),
+            "source": RowView(self._source_columns, pos),
+            "target": RowView(self._target_columns, pos),
+            "diff_fields": list(self._field_names[self.flags[pos]]),
+        }
+
+    def field_flags(self, field):
+        """某字段的差异标记列，不参与比对的字段全为 False"""
+        if field in self.fields:
+            return self.flags[:, self.fields.index(field)]
+        return np.zeros(len(self), dtype=bool)
+
+    def values(self, side, field):
+        """某侧（'source' / 'target'）某字段的整列取值，没有该列时全为 None"""
+        columns = self._source_columns if side == "source" else self._target_columns
+        if field in columns:
+            return columns[field]
+        return np.full(len(self), None, dtype=object)
@@ -0,0 +1,171 @@
+# result_viewer.py
+"""
+比对结果浏览：QTableView + 按需加载的表格模型，直接读取 CompareWorker 的比对结果索引，
+滚动到底部时才追加下一页，可按对比结果、差异字段筛选，点击主键列表头排序，无需先导出
+"""
+import numpy as np
+from PyQt5.QtWidgets import QWidget, QLabel, QComboBox, QTableView, QVBoxLayout, QHBoxLayout, QAbstractItemView
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QColor
+from result_index import RESULT_COLUMN, STATUS_LABELS, STATUS_EQUAL, STATUS_DIFF, STATUS_MISSING, STATUS_EXTRA
+
+KEY_COLUMN_TITLE = "主键"
+DIFF_COLOR = QColor('#FF0000')
+
+
+class ResultTableModel(QAbstractTableModel):
+    """列：主键、对比结果、各字段差异说明；行为筛选、排序后的结果位置，每次追加 PAGE_SIZE 行"""
+    PAGE_SIZE = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._results = None
+        self._rows = np.empty(0, dtype=np.int64)  # 当前显示顺序对应的结果位置
+        self._loaded = 0
+        self._headers = []
+        self._status = None
+        self._field = None
+        self._descending = None  # None 为原顺序，否则按主键升序/降序
+
+    def set_results(self, results):
+        """results 为 ResultIndex，None 时清空"""
+        self.beginResetModel()
+        self._results = results
+        self._headers = [KEY_COLUMN_TITLE, RESULT_COLUMN] + (results.fields if results is not None else [])
+        self._status = self._field = self._descending = None
+        self._select()
+        self.endResetModel()
+
+    def set_filter(self, status=None, field=None):
+        self.beginResetModel()
+        self._status, self._field = status, field
+        self._select()
+        self.endResetModel()
+
+    def total(self):
+        """筛选后的总行数（包括尚未加载的）"""
+        return len(self._rows)
+
+    def _select(self):
+        if self._results is None:
+            self._rows = np.empty(0, dtype=np.int64)
+        else:
+            self._rows = self._results.select(self._status, self._field)
+            if self._descending is not None:
+                self._rows = self._results.sort_by_key(self._rows, self._descending)
+        self._loaded = min(self.PAGE_SIZE, len(self._rows))
+
+    # ---------- QAbstractTableModel ----------
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or self._results is None:
+            return None
+        pos = self._rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                key = self._results.keys[pos]
+                return "" if key is None else str(key)
+            if column == 1:
+                return STATUS_LABELS[self._results.status[pos]]
+            return self._results.details[self._headers[column]][pos]
+        if role == Qt.ForegroundRole:
+            if column == 1 and self._results.status[pos] != STATUS_EQUAL:
+                return DIFF_COLOR
+            if column > 1 and self._results.details[self._headers[column]][pos]:
+                return DIFF_COLOR
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._headers[section] if section < len(self._headers) else None
+        return str(section + 1)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self._rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.PAGE_SIZE, len(self._rows) - self._loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """只支持按主键排序，点其他列恢复原顺序"""
+        self.layoutAboutToBeChanged.emit()
+        self._descending = (order == Qt.DescendingOrder) if column == 0 else None
+        self._select()
+        self.layoutChanged.emit()
+
+
+class ResultViewer(QWidget):
+    """比对结果页签：筛选条件 + 结果表格"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.status_combo = QComboBox()
+        self.status_combo.addItem("全部", None)
+        for status in (STATUS_DIFF, STATUS_MISSING, STATUS_EXTRA):
+            self.status_combo.addItem(STATUS_LABELS[status], status)
+        self.field_combo = QComboBox()
+        self.field_combo.addItem("全部字段", None)
+        self.count_label = QLabel("")
+
+        self.model = ResultTableModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.setSortingEnabled(True)
+
+        self.status_combo.currentIndexChanged.connect(self.apply_filter)
+        self.field_combo.currentIndexChanged.connect(self.apply_filter)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("对比结果："))
+        filter_layout.addWidget(self.status_combo)
+        filter_layout.addWidget(QLabel("差异字段："))
+        filter_layout.addWidget(self.field_combo)
+        filter_layout.addStretch()
+        filter_layout.addWidget(self.count_label)
+
+        layout = QVBoxLayout()
+        layout.addLayout(filter_layout)
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+
+    def set_results(self, results):
+        """显示 ResultIndex 中的比对结果，None 时清空"""
+        self.field_combo.blockSignals(True)
+        self.status_combo.blockSignals(True)
+        self.field_combo.clear()
+        self.field_combo.addItem("全部字段", None)
+        for field in (results.fields if results is not None else []):
+            self.field_combo.addItem(field, field)
+        self.status_combo.setCurrentIndex(0)
+        self.field_combo.blockSignals(False)
+        self.status_combo.blockSignals(False)
+
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.model.set_results(results)
+        self._update_count()
+
+    def clear(self):
+        self.set_results(None)
+
+    def apply_filter(self):
+        self.model.set_filter(self.status_combo.currentData(), self.field_combo.currentData())
+        self._update_count()
+
+    def _update_count(self):
+        self.count_label.setText(f"共 {self.model.total()} 条" if self.model.total() else "")
@@ -0,0 +1,277 @@
+# rule_expr.py
+"""
+计算规则（calc_rule）编译器：每条规则只解析一次成语法树，再分别生成
+1. SQL 片段（MySQL / sqlite 通用），供导入后的 UPDATE 计算字段使用
+2. pandas 向量化求值函数，供导入时算 _pk_concat、内存比对和导出使用
+两条路径出自同一棵语法树，保证数据库里算出的值与导出时算出的主键一致
+
+支持的写法：
+    文本：字段1+字段2+'常量'、字段[:12]
+    数值：四则运算与括号，如 使用年限+使用期间/12、累计购置值 - 累计折旧额
+"""
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from data_handler import sanitize_column_name, to_number
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>\d+(?:\.\d+)?)
+      | (?P<name>[^\W\d]\w*)
+      | (?P<string>'[^']*'|"[^"]*")
+      | (?P<op>[-+*/()\[\]:])
+    )""", re.VERBOSE)
+
+
+# =========================================================
+# 语法树
+# =========================================================
+class _Field:
+    def __init__(self, name):
+        self.name = name
+
+    def to_sql(self, numeric):
+        col = f"`{sanitize_column_name(self.name)}`"
+        # 乘 1.0 按小数参与运算（sqlite 中文本列按整数做除法会整除）
+        return f"({col} * 1.0)" if numeric else col
+
+    def evaluate(self, df, numeric):
+        if self.name in df.columns:
+            values = df[self.name]
+        elif sanitize_column_name(self.name) in df.columns:
+            values = df[sanitize_column_name(self.name)]
+        else:
+            raise Exception(f"字段不存在：{self.name}")
+        return _as_number(values) if numeric else _as_text(values)
+
+
+class _Literal:
+    def __init__(self, value):
+        self.value = value
+
+    def to_sql(self, numeric):
+        if numeric:
+            return self.value
+        return "'" + self.value.replace("'", "''") + "'"
+
+    def evaluate(self, df, numeric):
+        if numeric:
+            return pd.Series(float(self.value), index=df.index)
+        return pd.Series(self.value, index=df.index, dtype=object)
+
+
+class _BinOp:
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def to_sql(self, numeric):
+        if not numeric:
+            # 文本只有拼接；展开成一个 CONCAT，任一为 NULL 结果为 NULL
+            return f"CONCAT({', '.join(part.to_sql(False) for part in self._concat_parts())})"
+        return f"({self.left.to_sql(True)} {self.op} {self.right.to_sql(True)})"
+
+    def _concat_parts(self):
+        for node in (self.left, self.right):
+            if isinstance(node, _BinOp):
+                yield from node._concat_parts()
+            else:
+                yield node
+
+    def evaluate(self, df, numeric):
+        left = self.left.evaluate(df, numeric)
+        right = self.right.evaluate(df, numeric)
+        if not numeric:
+            return left + right  # object 列相加，None 参与则为 NaN，与 CONCAT 一致
+        if self.op == '+':
+            return left + right
+        if self.op == '-':
+            return left - right
+        if self.op == '*':
+            return left * right
+        # 与 MySQL 一致：除数为 0 时结果为 NULL
+        return left / right.where(right != 0)
+
+
+class _Negate:
+    def __init__(self, operand):
+        self.operand = operand
+
+    def to_sql(self, numeric):
+        return f"(-{self.operand.to_sql(True)})"
+
+    def evaluate(self, df, numeric):
+        return -self.operand.evaluate(df, True)
+
+
+class _Slice:
+    def __init__(self, operand, length):
+        self.operand = operand
+        self.length = length
+
+    def to_sql(self, numeric):
+        sql = f"SUBSTR({self.operand.to_sql(False)}, 1, {self.length})"  # 等价于 LEFT，sqlite 中 LEFT 是关键字
+        return f"({sql} * 1.0)" if numeric else sql
+
+    def evaluate(self, df, numeric):
+        values = self.operand.evaluate(df, False).str[:self.length]
+        return _as_number(values) if numeric else values
+
+
+def _as_text(values):
+    """非空值统一转成字符串，空值保持 None"""
+    return values.astype(str).astype(object).where(values.notna(), None)
+
+
+def _as_number(values):
+    """按 MySQL 的隐式转换取数：非数字文本当 0，空值为 NaN"""
+    if pd.api.types.is_float_dtype(values):
+        return values
+    numbers = to_number(values)
+    return numbers.where(values.isna() | numbers.notna(), 0.0)
+
+
+# =========================================================
+# 解析
+# =========================================================
+class _Parser:
+    """递归下降：expr := term (('+'|'-') term)*，term := unary (('*'|'/') unary)*"""
+
+    def __init__(self, text):
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+
+    @staticmethod
+    def _tokenize(text):
+        tokens, pos = [], 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = _TOKEN_RE.match(text, pos)
+            if not match or match.end() == pos:
+                raise Exception(f"无法识别的字符：{text[pos:].strip()[:10]}")
+            kind = match.lastgroup
+            tokens.append((kind, match.group(kind)))
+            pos = match.end()
+        return tokens
+
+    def _peek(self):
+        return self.tokens[self.pos][1] if self.pos < len(self.tokens) else None
+
+    def _take(self, expected=None):
+        if self.pos >= len(self.tokens):
+            raise Exception("表达式不完整")
+        kind, value = self.tokens[self.pos]
+        if expected is not None and value != expected:
+            raise Exception(f"此处应为 '{expected}'，实际为 '{value}'")
+        self.pos += 1
+        return kind, value
+
+    def parse(self):
+        node = self._expr()
+        if self.pos != len(self.tokens):
+            raise Exception(f"多余的内容：{self._peek()}")
+        return node
+
+    def _expr(self):
+        node = self._term()
+        while self._peek() in ('+', '-'):
+            op = self._take()[1]
+            node = _BinOp(op, node, self._term())
+        return node
+
+    def _term(self):
+        node = self._unary()
+        while self._peek() in ('*', '/'):
+            op = self._take()[1]
+            node = _BinOp(op, node, self._unary())
+        return node
+
+    def _unary(self):
+        if self._peek() == '-':
+            self._take()
+            return _Negate(self._unary())
+        node = self._primary()
+        while self._peek() == '[':
+            self._take('[')
+            self._take(':')
+            kind, length = self._take()
+            if kind != 'number' or '.' in length:
+                raise Exception("截取长度必须是整数")
+            self._take(']')
+            node = _Slice(node, int(length))
+        return node
+
+    def _primary(self):
+        kind, value = self._take()
+        if kind == 'number':
+            return _Literal(value)
+        if kind == 'string':
+            return _Literal(value[1:-1])
+        if kind == 'name':
+            return _Field(value)
+        if value == '(':
+            node = self._expr()
+            self._take(')')
+            return node
+        raise Exception(f"此处不应出现 '{value}'")
+
+
+class CompiledRule:
+    """编译后的计算规则"""
+
+    def __init__(self, calc_rule, data_type, tree):
+        self.calc_rule = calc_rule
+        self.numeric = data_type == "数值"
+        self.tree = tree
+        self.fields = tuple(dict.fromkeys(_collect_fields(tree)))
+
+    def to_sql(self):
+        """SQL 片段；数值规则中空值/除零得 NULL，由调用方决定是否 COALESCE"""
+        return self.tree.to_sql(self.numeric)
+
+    def evaluate(self, df):
+        """按列向量化求值，返回与 df 同索引的 Series（不复制 df）"""
+        try:
+            result = self.tree.evaluate(df, self.numeric)
+        except Exception as e:
+            raise Exception(f"计算规则执行失败（{self.calc_rule}）：{str(e)}")
+        if self.numeric:
+            return result.replace([np.inf, -np.inf], np.nan)
+        return result.astype(object).where(result.notna(), None)
+
+
+def _collect_fields(node):
+    if isinstance(node, _Field):
+        yield node.name
+    elif isinstance(node, _BinOp):
+        yield from _collect_fields(node.left)
+        yield from _collect_fields(node.right)
+    elif isinstance(node, (_Negate, _Slice)):
+        yield from _collect_fields(node.operand)
+
+
+def _check_text_tree(node):
+    """文本规则只允许 + 拼接和 [:n] 截取"""
+    if isinstance(node, _BinOp):
+        if node.op != '+':
+            raise Exception(f"文本规则不支持运算符 '{node.op}'")
+        _check_text_tree(node.left)
+        _check_text_tree(node.right)
+    elif isinstance(node, _Negate):
+        raise Exception("文本规则不支持负号")
+    elif isinstance(node, _Slice):
+        _check_text_tree(node.operand)
+
+
+@lru_cache(maxsize=None)
+def compile_rule(calc_rule, data_type):
+    """解析计算规则，相同 (规则, 类型) 只解析一次"""
+    try:
+        tree = _Parser(str(calc_rule)).parse()
+        if data_type != "数值":
+            _check_text_tree(tree)
+    except Exception as e:
+        raise Exception(f"计算规则解析失败（{calc_rule}）：{str(e)}")
+    return CompiledRule(calc_rule, data_type, tree)
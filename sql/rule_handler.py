@@ -1,44 +1,67 @@
 # rule_handler.py
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from types import MappingProxyType
 import pandas as pd
 from openpyxl import load_workbook
+from data_handler import sanitize_column_name, prepare_columns, CACHE_ROOT, ensure_cache_dir
+from rule_expr import compile_rule
+
+PK_COLUMN = '_pk_concat'
+PK_SEPARATOR = ' + '
+# 表一导入时写入的资产分类映射编码列
+CATEGORY_CODE_COLUMN = '_资产分类编码'
 
 def read_rules(file_path):
     """读取规则文件，返回规则字典"""
     try:
         wb = load_workbook(filename=file_path, read_only=True, data_only=True)
-        ws = wb['比对规则']
-        rules = {}
-
-        for row in ws.iter_rows(min_row=2, values_only=True):  # 假设第一行是标题
-            table1_field, table2_field, data_type, tail_diff, is_primary, calc_rule = row[:6]
-            if table1_field is None or table2_field is None:
-                continue  # 跳过空行
-            rules[table1_field] = {
-                "table2_field": table2_field,
-                "data_type": data_type.lower(),
-                "tail_diff": tail_diff,
-                "is_primary": is_primary == "是",
-                "calc_rule": calc_rule  # 新增：存储计算规则
-            }
+        rules = _parse_rules(wb)
         wb.close()
         return rules
     except Exception as e:
         raise Exception(f"读取规则文件时发生错误: {str(e)}")
 
+
+def _parse_rules(wb):
+    ws = wb['比对规则']
+    rules = {}
+
+    for row in ws.iter_rows(min_row=2, values_only=True):  # 假设第一行是标题
+        table1_field, table2_field, data_type, tail_diff, is_primary, calc_rule = row[:6]
+        if table1_field is None or table2_field is None:
+            continue  # 跳过空行
+        rules[table1_field] = {
+            "table2_field": table2_field,
+            "data_type": data_type.lower(),
+            "tail_diff": tail_diff,
+            "is_primary": is_primary == "是",
+            "calc_rule": calc_rule  # 新增：存储计算规则
+        }
+    return rules
+
 def read_enum_mapping(rule_file):
     """
     读取规则文件中的'枚举值-线站电压等级'页签
     返回 dict: 名称 -> 编码
     """
     try:
-        df = pd.read_excel(rule_file, sheet_name='枚举值-线站电压等级', dtype=str)
-        # 假设列名就是“编码”和“名称”
-        df = df[['编码', '名称']].dropna()
-        return dict(zip(df['名称'].astype(str).str.strip(),
-                        df['编码'].astype(str).str.strip()))
+        return _parse_enum_mapping(rule_file)
     except Exception as e:
         raise Exception(f"读取枚举值映射失败: {e}")
 
+
+def _parse_enum_mapping(source):
+    """source 可以是文件路径或已打开的 pd.ExcelFile"""
+    df = pd.read_excel(source, sheet_name='枚举值-线站电压等级', dtype=str)
+    # 假设列名就是“编码”和“名称”
+    df = df[['编码', '名称']].dropna()
+    return dict(zip(df['名称'].astype(str).str.strip(),
+                    df['编码'].astype(str).str.strip()))
+
 # 新增函数
 def read_erp_combo_map(rule_file):
     """
@@ -52,4 +75,182 @@ def read_erp_combo_map(rule_file):
     grouped = df.groupby('平台实物管理系统代码')['江苏ERP系统PM卡片ABC标识'] \
         .apply(lambda x: set(v for s in x for v in s.split('|'))) \
         .to_dict()
-    return grouped
\ No newline at end of file
+    return grouped
+
+
+def read_asset_category_mapping(rule_file):
+    """
+    读取'资产分类映射表'页签（跳过第一行）
+    返回 dict: 同源目录完整名称 -> 同源目录编码，同名取第一条；页签缺列时返回空字典
+    """
+    try:
+        df = pd.read_excel(rule_file, sheet_name='资产分类映射表', skiprows=1, dtype=str)
+    except Exception as e:
+        raise Exception(f"读取资产分类映射表失败: {str(e)}")
+    if df.empty or '同源目录完整名称' not in df.columns or '同源目录编码' not in df.columns:
+        return {}
+    df = df[['同源目录完整名称', '同源目录编码']].dropna().drop_duplicates('同源目录完整名称')
+    return dict(zip(df['同源目录完整名称'].astype(str), df['同源目录编码'].astype(str)))
+
+
+# =========================================================
+# 规则文件产物缓存
+# =========================================================
+class RuleArtifacts:
+    """
+    规则文件一次解析出的全部查找表：比对规则、枚举值映射、ERP 组合映射、资产分类映射
+    均为只读视图，CompareWorker、数据库准备和导出共用同一份
+    """
+
+    def __init__(self, rules, enum_map, erp_combo_map, category_mapping):
+        self.rules = MappingProxyType({k: MappingProxyType(v) for k, v in rules.items()})
+        self.enum_map = MappingProxyType(enum_map)
+        self.erp_combo_map = MappingProxyType({k: frozenset(v) for k, v in erp_combo_map.items()})
+        self.category_mapping = MappingProxyType(category_mapping)
+
+
+_artifact_cache = {}
+
+# 规则文件解析结果的磁盘缓存：按文件路径分文件存放（JSON），修改时间或内容哈希一致即直接加载
+RULE_CACHE_DIR = os.path.join(CACHE_ROOT, 'rules')
+# 解析逻辑或缓存结构变化时递增，旧缓存自动失效
+_RULE_CACHE_VERSION = 2
+
+
+def load_rule_artifacts(rule_file):
+    """
+    解析规则文件并缓存，文件未变化时直接复用上次结果
+    进程内按修改时间缓存；进程间依次比对修改时间、内容 SHA-256 命中磁盘缓存；都未命中才打开工作簿
+    工作簿只打开一次，各页签从同一个 ExcelFile 读取
+    """
+    path = os.path.abspath(rule_file)
+    mtime = os.path.getmtime(path)
+    cached = _artifact_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    data = _read_rule_cache(path, mtime)
+    if data is None:
+        try:
+            with pd.ExcelFile(path) as xls:
+                data = {
+                    "rules": _parse_rules(xls.book),
+                    "enum_map": _parse_enum_mapping(xls),
+                    "erp_combo_map": read_erp_combo_map(xls),
+                    "category_mapping": read_asset_category_mapping(xls),
+                }
+        except Exception as e:
+            raise Exception(f"读取规则文件时发生错误: {str(e)}")
+        _write_rule_cache(path, mtime, _file_sha256(path), data)
+
+    artifacts = RuleArtifacts(**data)
+    _artifact_cache[path] = (mtime, artifacts)
+    return artifacts
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _rule_cache_path(path):
+    return os.path.join(RULE_CACHE_DIR, hashlib.sha1(path.encode('utf-8')).hexdigest() + '.json')
+
+
+def _read_rule_cache(path, mtime):
+    """命中返回解析结果字典，未命中或缓存损坏返回 None"""
+    try:
+        with open(_rule_cache_path(path), encoding='utf-8') as fh:
+            entry = json.load(fh)
+        if entry.get("version") != _RULE_CACHE_VERSION:
+            return None
+        if entry["mtime"] == mtime:
+            return entry["data"]
+        # 修改时间变了但内容没变（如重新拷贝、保存未改动），只需刷新修改时间
+        sha256 = _file_sha256(path)
+        if entry["sha256"] == sha256:
+            _write_rule_cache(path, mtime, sha256, entry["data"])
+            return entry["data"]
+    except Exception:
+        pass
+    return None
+
+
+def _write_rule_cache(path, mtime, sha256, data):
+    """
+    先写临时文件再替换，避免并发或中断留下半个缓存文件；写失败不影响使用
+    ERP 组合映射的集合存成有序列表（RuleArtifacts 会转回 frozenset）；
+    无法按 JSON 原样还原的内容（如非字符串字段名、日期）不缓存
+    """
+    data = dict(data, erp_combo_map={k: sorted(v) for k, v in data["erp_combo_map"].items()})
+    entry = {"version": _RULE_CACHE_VERSION, "mtime": mtime, "sha256": sha256, "data": data}
+    try:
+        text = json.dumps(entry, ensure_ascii=False)
+        if json.loads(text) != entry:
+            return
+        ensure_cache_dir(RULE_CACHE_DIR)
+        fd, tmp_path = tempfile.mkstemp(dir=RULE_CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+            fh.write(text)
+        os.replace(tmp_path, _rule_cache_path(path))
+    except Exception as e:
+        logging.warning(f"写入规则缓存失败: {str(e)}")
+
+
+def build_pk_series(df, primary_keys, pk_rule, is_file1):
+    """
+    在导入阶段按块计算 _pk_concat（df 为已转成字符串的本块数据）
+    表一：主键列用 ' + ' 连接，空值跳过（等价于 CONCAT_WS）
+    表二：有计算规则按编译后的规则拼接各字段/常量，任一为空则结果为空（等价于 CONCAT）；否则直接取 table2_field
+    定义在模块级，便于传给子进程
+    """
+    if is_file1:
+        result = pd.Series(None, index=df.index, dtype=object)
+        for col in primary_keys:
+            value = df[sanitize_column_name(col)]
+            joined = result + PK_SEPARATOR + value
+            result = joined.where(result.notna() & value.notna(), result.where(result.notna(), value))
+        return result.fillna('')
+
+    calc_rule = pk_rule.get("calc_rule")
+    if not calc_rule:
+        col = pk_rule.get("table2_field")
+        if not col:
+            raise Exception("规则文件中未给 ERP 表定义主键字段")
+        return df[sanitize_column_name(col)]
+
+    return compile_rule(calc_rule, "文本").evaluate(df)
+
+
+def chunk_pk_series(chunk, column_types, primary_keys, pk_rule, is_file1):
+    """
+    从原始数据块按导入时的步骤算 _pk_concat：清洗列名、按规则类型转换主键涉及的列，再 build_pk_series
+    供导出等环节把原表各行与比对结果对齐，定义在模块级，便于传给子进程
+    """
+    if is_file1:
+        needed = primary_keys
+    elif pk_rule.get("calc_rule"):
+        needed = compile_rule(pk_rule["calc_rule"], "文本").fields
+    else:
+        needed = [pk_rule.get("table2_field")]
+    needed = {sanitize_column_name(col) for col in needed if col}
+    columns = [sanitize_column_name(col) for col in chunk.columns]
+    keep = [i for i, col in enumerate(columns) if col in needed]
+    names = [columns[i] for i in keep]
+    types = {sanitize_column_name(col): t for col, t in column_types.items()}
+    prepared = prepare_columns(chunk.iloc[:, keep].set_axis(names, axis=1), types, abs_depreciation=not is_file1)
+    frame = pd.DataFrame(dict(zip(names, prepared)), index=chunk.index)
+    return build_pk_series(frame, primary_keys, pk_rule, is_file1)
+
+
+def map_category_series(df, field, mapping):
+    """
+    资产分类名称 -> 同源目录编码，映射不到时保留原值，空值仍为空
+    （等价于原先按行执行的 IFNULL((SELECT 同源目录编码 ... LIMIT 1), 资产分类)）
+    """
+    values = df[sanitize_column_name(field)]
+    mapped = values.map(mapping)
+    return mapped.where(mapped.notna(), values)
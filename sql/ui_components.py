@@ -3,22 +3,18 @@ import sys
 import traceback
 import logging
 import os
-import shutil
-import time
 
 from PyQt5.QtWidgets import QWidget, QPushButton, QFileDialog, QLabel, QVBoxLayout, QHBoxLayout, \
-    QPlainTextEdit, QTabWidget, QComboBox, QProgressDialog, QApplication
+    QPlainTextEdit, QTabWidget, QComboBox, QCheckBox, QProgressDialog, QApplication
 from PyQt5.QtCore import Qt
-from openpyxl import load_workbook
 
 from data_handler import LoadColumnWorker
-from rule_handler import read_rules
-from comparator import CompareWorker
-from concurrent.futures import ThreadPoolExecutor
-from pathlib import Path
+from rule_handler import load_rule_artifacts
+from comparator import CompareWorker, BACKEND_MYSQL, BACKEND_SQLITE, BACKEND_MEMORY
+from db_handler import DB_ENGINE, set_db_engine, clear_import_store
+from exporter import ExportWorker
+from result_viewer import ResultViewer
 import pandas as pd
-import polars as pl           # 超大数据用
-import xlsxwriter             # 高速写
 
 
 
@@ -33,6 +29,7 @@ class ExcelComparer(QWidget):
         self.sheet_name2 = ""
         self.initUI()
         self.worker = None
+        self.export_worker = None
         self.summary_data = {}
         self.columns1 = []
         self.columns2 = []
@@ -61,7 +58,7 @@ class ExcelComparer(QWidget):
             rule_file_path = os.path.join(exe_dir, "rule.xlsx")
             self.rule_file = rule_file_path
             if os.path.exists(rule_file_path):
-                self.rules = read_rules(rule_file_path)
+                self.rules = load_rule_artifacts(rule_file_path).rules
                 self.log(f"✅ 成功加载规则文件: {rule_file_path}")
             else:
                 self.log(f"❌ 未找到规则文件: {rule_file_path}")
@@ -118,7 +115,24 @@ class ExcelComparer(QWidget):
         self.export_btn.setFixedWidth(150)
         self.export_btn.setEnabled(False)
         self.export_btn.clicked.connect(self.export_report)
+        self.backend_label = QLabel("比对引擎：")
+        self.backend_combo = QComboBox()
+        self.backend_combo.addItem("MySQL", BACKEND_MYSQL)
+        self.backend_combo.addItem("SQLite", BACKEND_SQLITE)
+        self.backend_combo.addItem("内存", BACKEND_MEMORY)
+        # 增量比对：导入表按内容指纹保留在库中，下次只重比变化的主键（仅数据库引擎）
+        self.incremental_check = QCheckBox("增量比对")
+        self.clear_store_btn = QPushButton("清空导入仓库")
+        self.clear_store_btn.clicked.connect(self.clear_import_store)
+        self.backend_combo.currentIndexChanged.connect(self.on_backend_changed)
+        # 默认选中配置的存储引擎（DB_ENGINE）
+        self.backend_combo.setCurrentIndex(max(0, self.backend_combo.findData(DB_ENGINE)))
+        self.on_backend_changed()
         button_layout.addStretch()
+        button_layout.addWidget(self.backend_label)
+        button_layout.addWidget(self.backend_combo)
+        button_layout.addWidget(self.incremental_check)
+        button_layout.addWidget(self.clear_store_btn)
         button_layout.addWidget(self.compare_btn)
         button_layout.addWidget(self.export_btn)
         # 日志和报告区域
@@ -130,7 +144,9 @@ class ExcelComparer(QWidget):
         self.summary_area.setReadOnly(True)
         self.summary_area.setStyleSheet("background-color: #f0f0f0;")
         self.tab_widget.addTab(self.log_area, "比对日志")
+        self.result_viewer = ResultViewer()
         self.tab_widget.addTab(self.summary_area, "汇总报告")
+        self.tab_widget.addTab(self.result_viewer, "比对结果")
         # 主布局组合
         main_layout.addLayout(file_layout)
         main_layout.addLayout(button_layout)
@@ -143,6 +159,9 @@ class ExcelComparer(QWidget):
         if hasattr(self, 'worker') and self.worker is not None and self.worker.isRunning():
             self.worker.quit()
             self.worker.wait()
+        if self.export_worker is not None and self.export_worker.isRunning():
+            self.export_worker.cancel()
+            self.export_worker.wait()
         if hasattr(self, 'worker_load1') and self.worker_load1 is not None and self.worker_load1.isRunning():
             self.worker_load1.quit()
             self.worker_load1.wait()
@@ -175,6 +194,7 @@ class ExcelComparer(QWidget):
         self.compare_btn.setEnabled(False)
         self.log_area.clear()
         self.summary_area.clear()
+        self.result_viewer.clear()
         self.export_btn.setEnabled(False)
 
     def select_file1(self):
@@ -236,6 +256,24 @@ class ExcelComparer(QWidget):
         # 简单更新比较按钮状态
         self.update_compare_button_state()
 
+    def on_backend_changed(self):
+        """内存引擎不使用导入仓库"""
+        uses_store = self.backend_combo.currentData() != BACKEND_MEMORY
+        self.incremental_check.setEnabled(uses_store)
+        self.clear_store_btn.setEnabled(uses_store)
+
+    def clear_import_store(self):
+        """删除所选数据库引擎中保留的全部导入表，增量比对从下次起重新全量导入"""
+        if self.worker is not None and self.worker.isRunning():
+            self.log("比对进行中，请稍后再清空导入仓库")
+            return
+        try:
+            set_db_engine('sqlite' if self.backend_combo.currentData() == BACKEND_SQLITE else 'mysql')
+            count = clear_import_store()
+            self.log(f"✅ 已清空导入仓库，删除 {count} 张导入表")
+        except Exception as e:
+            self.log(f"❌ {e}")
+
     def update_compare_button_state(self):
         sheet_selected = self.sheet_combo1.currentText() and self.sheet_combo2.currentText()
         if not sheet_selected:
@@ -256,6 +294,7 @@ class ExcelComparer(QWidget):
 
         self.log_area.clear()
         self.summary_area.clear()
+        self.result_viewer.clear()
         self.export_btn.setEnabled(False)
 
         # 获取主键字段
@@ -271,14 +310,23 @@ class ExcelComparer(QWidget):
 
         self.worker = CompareWorker(self.file1, self.file2, self.rule_file, sheet_name1, sheet_name2,
                                     primary_keys=primary_keys,
-                                    rules=self.rules)
+                                    rules=self.rules,
+                                    backend=self.backend_combo.currentData(),
+                                    incremental=self.incremental_check.isChecked())
         self.worker.log_signal.connect(self.log)
+        self.worker.progress_signal.connect(self.update_progress)
         # 连接信号以在比较完成时关闭对话框
         self.worker.finished.connect(self.close_loading_dialog)
         self.worker.finished.connect(lambda: self.export_btn.setEnabled(True))
         self.worker.finished.connect(self.on_compare_finished)
         self.worker.start()
 
+    def update_progress(self, value):
+        """比对进度（0~100），收到第一次进度后加载框由忙碌状态切换为进度条"""
+        if self.loading_dialog:
+            self.loading_dialog.setMaximum(100)
+            self.loading_dialog.setValue(value)
+
     def close_loading_dialog(self):
         """关闭加载对话框"""
         if self.loading_dialog:
@@ -316,6 +364,7 @@ class ExcelComparer(QWidget):
                     f"• 差异数据占比：{diff_ratio:.2%}\n"
                 )
                 self.summary_area.setPlainText(summary_text)
+                self.result_viewer.set_results(self.worker.result_index)
                 self.export_btn.setEnabled(True)
         except Exception as e:
             self.summary_area.setPlainText(f"❌ 显示汇总报告时发生错误：{str(e)}\n请查看比对日志了解详细信息。")
@@ -330,170 +379,50 @@ class ExcelComparer(QWidget):
         if not directory:
             return
         tasks = [
-            (self.file1, self.sheet_combo1.currentText(), True, directory),
-            (self.file2, self.sheet_combo2.currentText(), False, directory)
+            (self.file1, self.sheet_combo1.currentText(), True),
+            (self.file2, self.sheet_combo2.currentText(), False)
         ]
-        t0 = time.time()
-        self.loading_dialog = QProgressDialog("正在导出报告，请稍候...", None, 0, 0, self)
+        self.export_btn.setEnabled(False)
+        self.compare_btn.setEnabled(False)
+        self.export_rows = {}
+        self.loading_dialog = QProgressDialog("正在导出报告，请稍候...", "取消", 0, 0, self)
         self.loading_dialog.setWindowModality(Qt.WindowModal)
         self.loading_dialog.setWindowTitle("导出")
-        self.loading_dialog.setCancelButton(None)
+        self.loading_dialog.setAutoClose(False)
+        self.loading_dialog.setAutoReset(False)
+
+        self.export_worker = ExportWorker(self.worker, tasks, directory)
+        self.export_worker.log_signal.connect(self.log)
+        self.export_worker.progress_signal.connect(self.update_progress)
+        self.export_worker.file_progress_signal.connect(self.update_export_rows)
+        self.export_worker.finished.connect(self.on_export_finished)
+        self.loading_dialog.canceled.connect(self.cancel_export)
         self.loading_dialog.show()
-        with ThreadPoolExecutor(max_workers=2) as pool:
-            pool.map(lambda t: self._export_final(*t), tasks)
-        self.log(f"✅ 并行导出完成，总耗时 {time.time() - t0:.1f}s")
+        self.export_worker.start()
+
+    def update_export_rows(self, file_name, rows):
+        """导出进度：显示每个文件已写出的行数"""
+        self.export_rows[file_name] = rows
+        if self.loading_dialog and not self.loading_dialog.wasCanceled():
+            self.loading_dialog.setLabelText("正在导出报告...\n" + "\n".join(
+                f"{name}：已写出 {count} 行" for name, count in self.export_rows.items()))
+
+    def cancel_export(self):
+        """取消导出：子进程写完当前块后退出，未完成的文件会被删除"""
+        if self.export_worker is not None and self.export_worker.isRunning():
+            self.export_worker.cancel()
+            if self.loading_dialog:
+                self.loading_dialog.setLabelText("正在取消导出...")
+
+    def on_export_finished(self):
         self.close_loading_dialog()
-
-    # ---------- 最终导出实现 ----------
-    def _export_final(self, src_file, sheet_name, is_first_file, out_dir):
-        try:
-
-            # 1. 复制原文件
-            dst = Path(out_dir) / f"{Path(src_file).stem}_比对结果.xlsx"
-            shutil.copy2(src_file, dst)
-            # 1.1 去掉只读属性（Windows / Linux / macOS 通用）
-            try:
-                os.chmod(dst, 0o666)  # Linux / macOS
-            except Exception:
-                pass  # Windows 会抛异常，忽略即可
-            wb = load_workbook(filename=dst, read_only=False)
-            ws = wb[sheet_name]
-            has_merged_cell = False
-            for row in ws.iter_rows(max_row=2):
-                for cell in row:
-                    if cell.coordinate in ws.merged_cells:
-                        has_merged_cell = True
-                        break
-            if not is_first_file:
-                # 遍历合并单元格范围
-                if has_merged_cell:
-                    df = pd.read_excel(dst, sheet_name=sheet_name, skiprows=1, dtype=str).fillna("")
-                else:
-                    # 2. 读原表（全部字符串，防类型问题）
-                    df = pd.read_excel(dst, sheet_name=sheet_name, dtype=str).fillna("")
-            else:
-                df = pd.read_excel(dst, sheet_name=sheet_name, dtype=str).fillna("")
-
-            # 3. 动态主键字段
-            primary_keys = [f for f, r in self.rules.items() if r.get("is_primary")]
-
-            # 4. 计算行主键（与比对阶段一致）
-            if is_first_file:
-                # 平台表：直接取主键列
-                df["_key"] = df[primary_keys].astype(str).agg(" + ".join, axis=1)
-            else:
-                # ERP表：根据规则里的计算表达式动态生成
-                pk_field = next(f for f, r in self.rules.items() if r.get("is_primary"))
-                rule = self.rules[pk_field]
-                if rule.get("calc_rule"):
-                    df["_key"] = self.worker.calculate_field(df, rule["calc_rule"], rule["data_type"]).astype(str)
-                else:
-                    df["_key"] = df[rule["table2_field"]].astype(str)
-
-            # 5. 建立差异映射
-            diff_map, miss, extra = {}, set(), set()
-            for it in getattr(self.worker, 'diff_full_rows', []):
-                key = " + ".join([str(it['source' if is_first_file else 'target'].get(pk, ""))
-                                  for pk in primary_keys])
-                diff_map[key] = it
-            for row in getattr(self.worker, 'missing_rows', []):
-                miss.add(" + ".join([str(row.get(pk, "")) for pk in primary_keys]))
-            for row in getattr(self.worker, 'extra_in_file2', []):
-                extra.add(" + ".join([str(row.get(pk, "")) for pk in primary_keys]))
-
-            # 6. 需要追加的列（顺序 = 规则顺序）
-            comp_cols = [f for f in self.rules.keys() if not self.rules[f].get("is_primary")]
-
-            # 7. 计算追加值
-            keys = df["_key"].tolist()
-            comp_results = [
-                "此数据不存在于SAP" if k in miss else  # 平台表多余 → 提示不存在于SAP
-                "此数据不存在于平台" if k in extra else  # ERP表多余 → 提示不存在于平台
-                "不一致" if k in diff_map else
-                "一致"
-                for k in keys
-            ]
-
-            def detail(row_key, fld):
-                if row_key not in diff_map:
-                    return ""
-                s, t = diff_map[row_key]['source'], diff_map[row_key]['target']
-
-                # 资产分类特殊处理：用中文提示
-                if fld == "资产分类":
-                    code1 = s.get(fld, "")
-                    code2 = t.get('原21版资产分类', "")
-                    v1 = self.worker.asset_code_map.get(code1, code1)
-                    v2 = t.get(fld)
-
-                    # 资产分类使用code1和code2进行比较
-                    if self.worker.values_equal_by_rule(code1, code2,
-                                                        self.rules[fld]["data_type"],
-                                                        self.rules[fld].get("tail_diff"),
-                                                        fld):
-                        return ""
-                    return f"不一致：平台表={v1 or ''}, ERP表={v2 or ''}"
-                else:
-                    # 其他字段使用v1和v2进行比较
-                    v1 = self.normalize_value(s.get(fld, ""))
-                    v2 = self.normalize_value(t.get(fld, ""))
-
-                    if self.worker.values_equal_by_rule(v1, v2,
-                                                        self.rules[fld]["data_type"],
-                                                        self.rules[fld].get("tail_diff"),
-                                                        fld):
-                        return ""
-                    return f"不一致：平台表={v1 or ''}, ERP表={v2 or ''}"
-
-            comp_details = {
-                fld: [detail(k, fld) for k in keys]
-                for fld in comp_cols
-            }
-
-            # 8. 用 xlsxwriter 重写副本：不改动原列，仅追加
-            with xlsxwriter.Workbook(dst, {'nan_inf_to_errors': True}) as wb:
-                ws = wb.add_worksheet(sheet_name)
-                header_fmt = wb.add_format({'bold': True, 'bg_color': '#FFC7CE'})
-                red_fmt = wb.add_format({'bg_color': '#FF0000', 'font_color': '#FFFFFF'})
-
-                orig_cols = len(df.columns) - 1  # 去掉 _key
-                orig_rows = len(df)
-
-                # 原标题
-                for c, col_name in enumerate(df.columns[:-1]):
-                    ws.write(0, c, col_name, header_fmt)
-                # 原数据
-                for r in range(orig_rows):
-                    for c in range(orig_cols):
-                        ws.write(r + 1, c, df.iloc[r, c])
-
-                # 追加“对比结果”
-                next_col = orig_cols
-                ws.write(0, next_col, "对比结果", header_fmt)
-                for r in range(orig_rows):
-                    val = comp_results[r]
-                    ws.write(r + 1, next_col, val)
-                    if val != "一致":
-                        ws.write(r + 1, next_col, val, red_fmt)
-
-                # 依次追加规则字段列
-                for fld in comp_cols:
-                    next_col += 1
-                    ws.write(0, next_col, fld, header_fmt)
-                    for r in range(orig_rows):
-                        val = comp_details[fld][r]
-                        ws.write(r + 1, next_col, val)
-                        if val:
-                            ws.write(r + 1, next_col, val, red_fmt)
-
-            self.log(f"✅ 导出完成 {dst.name}")
-        except Exception as e:
-            self.log(f"❌ 导出失败 {Path(src_file).name}: {e}")
+        self.export_btn.setEnabled(True)
+        self.update_compare_button_state()
 
     def _rename_erp_columns(self, df, rules):
         """
         把 ERP 的 Unnamed: X 列名，按规则顺序映射成 table2_field，
-        使得 calculate_field 里的字段名都能匹配到真实列。
+        使得计算规则里的字段名都能匹配到真实列。
         """
         # 建立“规则顺序 -> 实际列名”映射
         rename_map = {}
@@ -511,134 +440,6 @@ class ExcelComparer(QWidget):
             if idx < len(df.columns):
                 rename_map[df.columns[idx]] = tbl2
         return df.rename(columns=rename_map)
-    # ---------- 单文件导出 ----------
-    def _export_one_file(self, src_file, sheet_name, is_first_file, out_dir):
-        try:
-            # 自动选引擎：行数>5万→polars；否则pandas+xlsxwriter
-            quick_count = self._quick_row_count(src_file, sheet_name)
-            use_polars = quick_count > 50_000
-            dst = Path(out_dir) / f"{Path(src_file).stem}_比对结果.xlsx"
-            if use_polars:
-                self._write_with_polars(src_file, sheet_name, is_first_file, dst)
-            else:
-                self._write_with_xlsxwriter(src_file, sheet_name, is_first_file, dst)
-        except Exception as e:
-            self.log(f"❌ 导出失败 {Path(src_file).name}: {e}")
-
-    # ---------- 快速估算行数 ----------
-    def _quick_row_count(self, file_path, sheet_name):
-        try:
-            df = pd.read_excel(file_path, sheet_name=sheet_name, nrows=0)
-            with pd.ExcelFile(file_path) as xls:
-                return xls.book.sheet_by_name(sheet_name).nrows
-        except:
-            return 0
-
-    # ---------- 方案A：xlsxwriter + pandas ----------
-    def _write_with_xlsxwriter(self, src_file, sheet_name, is_first_file, dst_file):
-        # 1) 读数据
-        df = pd.read_excel(src_file, sheet_name=sheet_name)
-
-        # 2) 清理 NaN/Inf
-        df = df.replace([float('inf'), float('-inf')], None)  # 先转 None
-        df = df.where(pd.notnull(df), None)  # 再转 None（覆盖 NaN）
-
-        # 3) 计算对比列
-        df = self._add_comparison_columns(df, is_first_file)
-
-        # 4) 写文件，打开 nan_inf 容错
-        with xlsxwriter.Workbook(
-                dst_file,
-                {
-                    'constant_memory': True,
-                    'nan_inf_to_errors': True  # ← 关键
-                }
-        ) as wb:
-            ws = wb.add_worksheet(sheet_name)
-
-            header_fmt = wb.add_format({'bold': True, 'bg_color': '#FFC7CE'})
-            red_fmt = wb.add_format({'bg_color': '#FF0000', 'font_color': '#FFFFFF'})
-
-            # 写标题
-            for c, col in enumerate(df.columns):
-                ws.write(0, c, col, header_fmt)
-
-            # 批量写数据（None 会自动写成空单元格）
-            for r, row in enumerate(df.itertuples(index=False), start=1):
-                for c, val in enumerate(row):
-                    ws.write(r, c, "" if val is None else val)
-
-            # 标记差异行
-            try:
-                res_idx = df.columns.get_loc("对比结果")
-                for r in range(1, len(df) + 1):
-                    val = df.iloc[r - 1, res_idx]
-                    if val != "一致":
-                        ws.write(r, res_idx, val or "", red_fmt)
-            except Exception:
-                pass
-
-        self.log(f"✅ xlsxwriter 导出完成 {Path(dst_file).name}")
-
-    # ---------- 方案B：polars 零拷贝 ----------
-    def _write_with_polars(self, src_file, sheet_name, is_first_file, dst_file):
-        # 1) 读为 polars DataFrame
-        df = pl.read_excel(src_file, sheet_name=sheet_name)
-        # 2) 计算对比列（复用逻辑，转回 pandas 计算后转回 polars，极快）
-        pdf = self._add_comparison_columns(df.to_pandas(), is_first_file)
-        # 3) 写
-        pl.from_pandas(pdf).write_excel(dst_file, worksheet=sheet_name)
-        self.log(f"✅ polars 导出完成 {dst_file.name}")
-
-    # ---------- 计算对比列（复用原逻辑，稍作适配） ----------
-    def _add_comparison_columns(self, df: pd.DataFrame, is_first_file: bool):
-        primary_keys = [f for f, r in self.rules.items() if r["is_primary"]]
-        compare_cols = list(self.rules.keys())
-
-        df = df.copy()
-        # 主键列
-        df["_key"] = df[primary_keys].astype(str).agg(" + ".join, axis=1)
-
-        # 差异映射
-        diff_map, miss, extra = {}, set(), set()
-        for it in getattr(self.worker, 'diff_full_rows', []):
-            key = " + ".join([str(it['source' if is_first_file else 'target'].get(pk, '')) for pk in primary_keys])
-            diff_map[key] = it
-        for row in getattr(self.worker, 'missing_rows', []):
-            miss.add(" + ".join([str(row.get(pk, '')) for pk in primary_keys]))
-        for row in getattr(self.worker, 'extra_in_file2', []):
-            extra.add(" + ".join([str(row.get(pk, '')) for pk in primary_keys]))
-
-        # 对比结果
-        def comp(row):
-            k = row["_key"]
-            if k in miss:
-                return "此数据不存在于SAP" if is_first_file else "此数据不存在于平台"
-            if k in extra:
-                return "此数据不存在于平台" if is_first_file else "此数据不存在于SAP"
-            return "不一致" if k in diff_map else "一致"
-
-        df["对比结果"] = df.apply(comp, axis=1)
-
-        # 各列差异详情
-        for col in compare_cols:
-            if col not in df.columns:
-                continue
-
-            def detail(row):
-                k = row["_key"]
-                if k not in diff_map:
-                    return ""
-                s, t = diff_map[k]['source'], diff_map[k]['target']
-                v1, v2 = s.get(col, ""), t.get(col, "")
-                rule = self.rules.get(col, {})
-                if not self.worker.values_equal_by_rule(v1, v2, rule.get("data_type"), rule.get("tail_diff"), col):
-                    return f"不一致：平台表={v1}, ERP表={v2}"
-                return ""
-
-            df[col] = df.apply(detail, axis=1)
-
-        return df.drop(columns=["_key"])
     def log(self, message):
         """日志输出"""
         self.log_area.appendPlainText(message)